@@ -0,0 +1,122 @@
+import argparse, json, os, shutil, sys, tempfile
+from os import path
+import numpy as np
+import cv2
+
+from inference import build_args, face_boxes, read_frames
+
+PACK_VERSION = 1
+
+def build_pack(args, out_dir, detector=None):
+	"""Decode, detect and crop the --face source once and store the result as an avatar pack.
+
+	A pack is a directory of .npy arrays that inference.py memory-maps with --pack:
+	  frames.npy  (N, H, W, 3) uint8  source frames after resize_factor, rotate and crop
+	  faces.npy   (N, 96, 96, 3) uint8  face crops resized to the model input
+	  coords.npy  (N, 4) int32  where each face is pasted back (y1, y2, x1, x2)
+	  meta.json   fps, frame count and the settings the pack was built with
+	The arrays are written through memory maps, so building a long clip does not
+	hold it in RAM. The pack is built in a scratch directory next to out_dir and
+	renamed into place, so jobs that have an older version of it mapped keep
+	reading the old files. meta.json is written last; a pack without it is incomplete.
+	"""
+	if args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
+		image = cv2.imread(args.face)
+		open_frames = lambda: iter([image])
+		fps = args.fps
+	else:
+		video_stream = cv2.VideoCapture(args.face)
+		fps = video_stream.get(cv2.CAP_PROP_FPS)
+		video_stream.release()
+		if args.static:
+			first = next(read_frames(args))
+			open_frames = lambda: iter([first])
+		else:
+			open_frames = lambda: read_frames(args)
+
+	workdir = tempfile.mkdtemp(prefix='avatar_pack_', dir=args.tmp_dir)
+	try:
+		if args.box[0] == -1:
+			boxes = face_boxes(open_frames, sys.maxsize, args, workdir, detector)
+		else:
+			count = sum(1 for _ in open_frames())
+			boxes = np.array([[args.box[2], args.box[0], args.box[3], args.box[1]]] * count)
+	finally:
+		shutil.rmtree(workdir, ignore_errors=True)
+
+	frame_h, frame_w = next(open_frames()).shape[:2]
+	out_dir = path.abspath(out_dir)
+	os.makedirs(path.dirname(out_dir), exist_ok=True)
+	build_dir = tempfile.mkdtemp(prefix='.{}.'.format(path.basename(out_dir)), dir=path.dirname(out_dir))
+	try:
+		os.chmod(build_dir, 0o755)
+		meta = write_pack(build_dir, args, open_frames, boxes, fps, (frame_h, frame_w))
+	except BaseException:
+		shutil.rmtree(build_dir, ignore_errors=True)
+		raise
+
+	# Move the old pack aside rather than overwriting it: open memory maps keep its files alive
+	old_dir = None
+	if path.exists(out_dir):
+		old_dir = tempfile.mkdtemp(prefix='.{}.old.'.format(path.basename(out_dir)), dir=path.dirname(out_dir))
+		os.rename(out_dir, path.join(old_dir, 'pack'))
+	os.rename(build_dir, out_dir)
+	if old_dir:
+		shutil.rmtree(old_dir, ignore_errors=True)
+	return meta
+
+def write_pack(pack_dir, args, open_frames, boxes, fps, frame_size):
+	count = len(boxes)
+	frame_h, frame_w = frame_size
+	frames = np.lib.format.open_memmap(path.join(pack_dir, 'frames.npy'), mode='w+', dtype=np.uint8,
+								shape=(count, frame_h, frame_w, 3))
+	faces = np.lib.format.open_memmap(path.join(pack_dir, 'faces.npy'), mode='w+', dtype=np.uint8,
+								shape=(count, args.img_size, args.img_size, 3))
+	coords = np.lib.format.open_memmap(path.join(pack_dir, 'coords.npy'), mode='w+', dtype=np.int32, shape=(count, 4))
+
+	for i, frame in enumerate(open_frames()):
+		if i >= count:
+			break
+		x1, y1, x2, y2 = boxes[i]
+		frames[i] = frame
+		faces[i] = cv2.resize(frame[y1: y2, x1:x2], (args.img_size, args.img_size))
+		coords[i] = (y1, y2, x1, x2)
+
+	for array in (frames, faces, coords):
+		array.flush()
+	del frames, faces, coords
+
+	meta = {
+		'version': PACK_VERSION,
+		'source': path.abspath(args.face),
+		'fps': fps,
+		'count': count,
+		'width': frame_w,
+		'height': frame_h,
+		'img_size': args.img_size,
+		'settings': {'pads': args.pads, 'resize_factor': args.resize_factor, 'crop': args.crop,
+					'box': args.box, 'rotate': args.rotate, 'static': args.static, 'nosmooth': args.nosmooth},
+	}
+	with open(path.join(pack_dir, 'meta.json'), 'w') as f:
+		json.dump(meta, f, indent=2)
+	return meta
+
+def main():
+	parser = argparse.ArgumentParser(description='Precompute an avatar pack (frames, face crops and paste coordinates) for a recurring presenter video',
+									epilog='Detection options (--pads, --resize_factor, --crop, --box, --rotate, --nosmooth, --static, --fps, '
+									'--face_det_batch_size, --face_cache_dir) are the same as for inference.py.')
+	parser.add_argument('--face', type=str, help='Presenter video/image to pack', required=True)
+	parser.add_argument('--out', type=str, help='Directory to write the pack to', required=True)
+	opts, rest = parser.parse_known_args()
+
+	# The inference parser requires a checkpoint and audio, neither of which packing uses
+	args = build_args(['--checkpoint_path', '', '--audio', '', '--face', opts.face] + rest)
+	if not path.isfile(args.face):
+		raise ValueError('--face argument must be a valid path to video/image file')
+	os.makedirs(args.tmp_dir, exist_ok=True)
+
+	meta = build_pack(args, opts.out)
+	print('Wrote avatar pack with {} frame(s) at {} fps to {}'.format(meta['count'], meta['fps'], opts.out))
+
+if __name__ == '__main__':
+	main()
@@ -1,12 +1,11 @@
 from os import listdir, path
 import numpy as np
 import scipy, cv2, os, sys, argparse, audio
-import json, subprocess, random, string
+import json, subprocess, random, string, tempfile, shutil, itertools, hashlib, threading
 from tqdm import tqdm
 from glob import glob
 import torch, face_detection
 from models import Wav2Lip
-import platform
 
 parser = argparse.ArgumentParser(description='Inference code to lip-sync videos in the wild using Wav2Lip models')
 
@@ -14,7 +13,9 @@ parser.add_argument('--checkpoint_path', type=str,
 					help='Name of saved checkpoint to load weights from', required=True)
 
 parser.add_argument('--face', type=str, 
-					help='Filepath of video/image that contains faces to use', required=True)
+					help='Filepath of video/image that contains faces to use (not needed with --pack)', default=None)
+parser.add_argument('--pack', type=str, default=None,
+					help='Avatar pack built by avatar_pack.py; skips decoding, face detection and resizing of the source')
 parser.add_argument('--audio', type=str, 
 					help='Filepath of video/audio file to use as raw audio source', required=True)
 parser.add_argument('--outfile', type=str, help='Video path to save result. See default for an e.g.', 
@@ -50,11 +51,35 @@ parser.add_argument('--rotate', default=False, action='store_true',
 parser.add_argument('--nosmooth', default=False, action='store_true',
 					help='Prevent smoothing face detections over a short temporal window')
 
-args = parser.parse_args()
-args.img_size = 96
-
-if os.path.isfile(args.face) and args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
-	args.static = True
+parser.add_argument('--crf', type=int, default=18,
+					help='x264 quality of the output (lower is better)')
+parser.add_argument('--x264_preset', type=str, default='veryfast',
+					help='x264 speed preset of the output encode')
+parser.add_argument('--legacy_avi', default=False, action='store_true',
+					help='Write an intermediate DIVX AVI and mux it with ffmpeg afterwards (the old two-encode path)')
+
+parser.add_argument('--face_cache_dir', type=str, default='face_cache',
+					help='Where detected face boxes are cached per source file and detection settings (empty string disables)')
+
+parser.add_argument('--tmp_dir', type=str, default='temp',
+					help='Directory in which each run creates its own scratch folder, so concurrent runs do not collide')
+parser.add_argument('--keep_tmp', default=False, action='store_true',
+					help='Keep the scratch folder after the run, whether it succeeds or fails')
+parser.add_argument('--keep_failed', type=int, default=3,
+					help='Scratch folders of this many most recent failed runs are kept for debugging; older ones are removed')
+
+def build_args(argv=None, **overrides):
+	"""Parse command-line style options, then apply keyword overrides (service.py passes its job options this way)"""
+	args = parser.parse_args(argv)
+	for name, value in overrides.items():
+		if not hasattr(args, name):
+			raise ValueError('Unknown option: {}'.format(name))
+		setattr(args, name, value)
+	args.img_size = 96
+
+	if args.face and os.path.isfile(args.face) and args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
+		args.static = True
+	return args
 
 def get_smoothened_boxes(boxes, T):
 	for i in range(len(boxes)):
@@ -65,16 +90,16 @@ def get_smoothened_boxes(boxes, T):
 		boxes[i] = np.mean(window, axis=0)
 	return boxes
 
-def face_detect(images):
-	detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, 
+def load_detector():
+	return face_detection.FaceAlignment(face_detection.LandmarksType._2D, 
 											flip_input=False, device=device)
 
-	batch_size = args.face_det_batch_size
-	
+def _detect(detector, images, batch_size):
+	"""s3fd detections for a list of frames, halving the batch size on GPU OOM; returns (rects, batch_size)"""
 	while 1:
 		predictions = []
 		try:
-			for i in tqdm(range(0, len(images), batch_size)):
+			for i in range(0, len(images), batch_size):
 				predictions.extend(detector.get_detections_for_batch(np.array(images[i:i + batch_size])))
 		except RuntimeError:
 			if batch_size == 1: 
@@ -82,46 +107,180 @@ def face_detect(images):
 			batch_size //= 2
 			print('Recovering from OOM error; New batch size: {}'.format(batch_size))
 			continue
-		break
+		return predictions, batch_size
 
-	results = []
+def face_detect(frames, args, workdir, detector=None):
+	"""Padded (unsmoothed) face boxes (x1, y1, x2, y2) for an iterable of frames.
+
+	Frames are consumed in chunks of face_det_batch_size and only the boxes are
+	kept, so a long video never has to be held in memory.
+	"""
+	# A resident caller passes its warm detector; one-shot runs load it here and free it after
+	owns_detector = detector is None
+	if owns_detector:
+		detector = load_detector()
+
+	batch_size = args.face_det_batch_size
 	pady1, pady2, padx1, padx2 = args.pads
-	for rect, image in zip(predictions, images):
-		if rect is None:
-			cv2.imwrite('temp/faulty_frame.jpg', image) # check this frame where the face was not detected.
-			raise ValueError('Face not detected! Ensure the video contains a face in all the frames.')
-
-		y1 = max(0, rect[1] - pady1)
-		y2 = min(image.shape[0], rect[3] + pady2)
-		x1 = max(0, rect[0] - padx1)
-		x2 = min(image.shape[1], rect[2] + padx2)
-		
-		results.append([x1, y1, x2, y2])
-
-	boxes = np.array(results)
+	results = []
+
+	def process(chunk):
+		nonlocal batch_size
+		predictions, batch_size = _detect(detector, chunk, batch_size)
+		for rect, image in zip(predictions, chunk):
+			if rect is None:
+				cv2.imwrite(path.join(workdir, 'faulty_frame.jpg'), image) # check this frame where the face was not detected.
+				raise ValueError('Face not detected! Ensure the video contains a face in all the frames.')
+
+			y1 = max(0, rect[1] - pady1)
+			y2 = min(image.shape[0], rect[3] + pady2)
+			x1 = max(0, rect[0] - padx1)
+			x2 = min(image.shape[1], rect[2] + padx2)
+			
+			results.append([x1, y1, x2, y2])
+
+	chunk = []
+	for frame in tqdm(frames, desc='Face detection'):
+		chunk.append(frame)
+		if len(chunk) == args.face_det_batch_size:
+			process(chunk)
+			chunk = []
+	if chunk:
+		process(chunk)
+
+	if owns_detector:
+		del detector
+	return np.array(results)
+
+def face_cache_key(args):
+	"""Content hash of the --face file plus every setting that changes the detected boxes"""
+	digest = hashlib.sha256()
+	with open(args.face, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), b''):
+			digest.update(block)
+	settings = [args.pads, args.resize_factor, args.crop, args.rotate, args.static]
+	digest.update(json.dumps(settings).encode('utf-8'))
+	return digest.hexdigest()
+
+def face_boxes(open_frames, limit, args, workdir, detector=None):
+	"""Smoothed face boxes for the first `limit` source frames, from the face cache when possible.
+
+	The cache holds the raw padded boxes (smoothing is applied after slicing, so
+	--nosmooth runs share entries) and whether detection reached the end of the
+	source; an entry that covers fewer frames than needed is recomputed.
+	"""
+	cache_path = path.join(args.face_cache_dir, face_cache_key(args) + '.npz') if args.face_cache_dir else None
+	boxes = None
+	if cache_path and path.isfile(cache_path):
+		with np.load(cache_path) as cached:
+			if len(cached['boxes']) >= limit or bool(cached['complete']):
+				boxes = cached['boxes']
+				print('Using cached face detections from {}'.format(cache_path))
+
+	if boxes is None:
+		boxes = face_detect(open_frames(), args, workdir, detector)
+		if cache_path:
+			os.makedirs(args.face_cache_dir, exist_ok=True)
+			tmp_path = '{}.{}.{}.tmp'.format(cache_path, os.getpid(), threading.get_ident())
+			with open(tmp_path, 'wb') as f:
+				np.savez(f, boxes=boxes.astype(np.int32), complete=len(boxes) < limit)
+			os.replace(tmp_path, cache_path)
+
+	boxes = np.array(boxes[:limit])
 	if not args.nosmooth: boxes = get_smoothened_boxes(boxes, T=5)
-	results = [[image[y1: y2, x1:x2], (y1, y2, x1, x2)] for image, (x1, y1, x2, y2) in zip(images, boxes)]
+	return boxes
 
-	del detector
-	return results 
+def prepare_frame(frame, args):
+	if args.resize_factor > 1:
+		frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))
 
-def datagen(frames, mels):
-	img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+	if args.rotate:
+		frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
 
-	if args.box[0] == -1:
-		if not args.static:
-			face_det_results = face_detect(frames) # BGR2RGB for CNN face detection
-		else:
-			face_det_results = face_detect([frames[0]])
-	else:
-		print('Using the specified bounding box instead of face detection...')
-		y1, y2, x1, x2 = args.box
-		face_det_results = [[f[y1: y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
+	y1, y2, x1, x2 = args.crop
+	if x2 == -1: x2 = frame.shape[1]
+	if y2 == -1: y2 = frame.shape[0]
 
+	return frame[y1:y2, x1:x2]
+
+def read_frames(args):
+	"""Decode the --face video one frame at a time, with resize_factor, rotate and crop applied"""
+	video_stream = cv2.VideoCapture(args.face)
+	try:
+		while 1:
+			still_reading, frame = video_stream.read()
+			if not still_reading:
+				break
+			yield prepare_frame(frame, args)
+	finally:
+		video_stream.release()
+
+def prepare_faces(faces, args):
+	"""Model input for a batch of 96x96 face crops: the lower-half-masked copy stacked on the original, scaled to [0, 1]"""
+	img_batch = np.asarray(faces)
+
+	img_masked = img_batch.copy()
+	img_masked[:, args.img_size//2:] = 0
+
+	return np.concatenate((img_masked, img_batch), axis=3) / 255.
+
+def prepare_mels(mels):
+	mel_batch = np.asarray(mels)
+	return np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+
+def load_pack(pack_dir):
+	"""Open an avatar pack; frames, faces and coords are memory-mapped read-only, not loaded"""
+	meta_path = path.join(pack_dir, 'meta.json')
+	if not path.isfile(meta_path):
+		raise ValueError('{} is not a complete avatar pack (no meta.json)'.format(pack_dir))
+	with open(meta_path) as f:
+		pack = json.load(f)
+	for name in ('frames', 'faces', 'coords'):
+		pack[name] = np.load(path.join(pack_dir, name + '.npy'), mmap_mode='r')
+	return pack
+
+def static_datagen(still, box, mels, args):
+	"""Batches for a still source: the face is cropped, resized and masked once and broadcast over every batch.
+
+	The face input is a device tensor expanded (not copied) to the batch size,
+	and every frame in a batch is the same reused output buffer, which is fine
+	because each prediction is pasted over the same region and written before
+	the next one.
+	"""
+	x1, y1, x2, y2 = box
+	face = cv2.resize(still[y1: y2, x1:x2], (args.img_size, args.img_size))
+	face_tensor = torch.FloatTensor(np.transpose(prepare_faces([face], args), (0, 3, 1, 2))).to(device)
+	frame_buffer = still.copy()
+	coords = (y1, y2, x1, x2)
+
+	for start in range(0, len(mels), args.wav2lip_batch_size):
+		mel_batch = prepare_mels(mels[start:start + args.wav2lip_batch_size])
+		n = len(mel_batch)
+		yield face_tensor.expand(n, -1, -1, -1), mel_batch, [frame_buffer] * n, [coords] * n
+
+def datagen(open_frames, boxes, mels, args):
+	"""Batches for the model, decoding frames as they are needed.
+
+	open_frames() returns a fresh iterator over the source frames; it is called
+	again whenever the frames run out, so a clip shorter than the audio loops
+	as before. boxes holds one (x1, y1, x2, y2) per source frame, or None to use
+	the fixed --box. At most one batch of frames is alive at a time.
+	"""
+	img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+
+	frames, idx = open_frames(), 0
 	for i, m in enumerate(mels):
-		idx = 0 if args.static else i%len(frames)
-		frame_to_save = frames[idx].copy()
-		face, coords = face_det_results[idx].copy()
+		frame_to_save = next(frames, None)
+		if frame_to_save is None:
+			frames, idx = open_frames(), 0
+			frame_to_save = next(frames)
+
+		if boxes is None:
+			y1, y2, x1, x2 = args.box
+		else:
+			x1, y1, x2, y2 = boxes[idx]
+		idx += 1
+		face, coords = frame_to_save[y1: y2, x1:x2], (y1, y2, x1, x2)
 
 		face = cv2.resize(face, (args.img_size, args.img_size))
 			
@@ -131,27 +290,76 @@ def datagen(frames, mels):
 		coords_batch.append(coords)
 
 		if len(img_batch) >= args.wav2lip_batch_size:
-			img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
-
-			img_masked = img_batch.copy()
-			img_masked[:, args.img_size//2:] = 0
-
-			img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-			mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
-
-			yield img_batch, mel_batch, frame_batch, coords_batch
+			yield prepare_faces(img_batch, args), prepare_mels(mel_batch), frame_batch, coords_batch
 			img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
 
 	if len(img_batch) > 0:
-		img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
-
-		img_masked = img_batch.copy()
-		img_masked[:, args.img_size//2:] = 0
-
-		img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
-		mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
-
-		yield img_batch, mel_batch, frame_batch, coords_batch
+		yield prepare_faces(img_batch, args), prepare_mels(mel_batch), frame_batch, coords_batch
+
+def pack_datagen(pack, mels, args):
+	"""Batches from an avatar pack: the 96x96 faces go to the model as stored, and only
+	the frames that get pasted into are copied out of the memory map.
+
+	Pack frames are cycled when the audio is longer than the pack. A one-frame
+	pack reuses a single output buffer, as static_datagen does.
+	"""
+	frames, faces, coords = pack['frames'], pack['faces'], pack['coords'].tolist()
+	n_frames = len(frames)
+	still = np.array(frames[0]) if n_frames == 1 else None
+
+	for start in range(0, len(mels), args.wav2lip_batch_size):
+		mel_batch = prepare_mels(mels[start:start + args.wav2lip_batch_size])
+		idx = [i % n_frames for i in range(start, start + len(mel_batch))]
+		frame_batch = [still] * len(idx) if still is not None else [np.array(frames[i]) for i in idx]
+		yield prepare_faces(faces[idx], args), mel_batch, frame_batch, [tuple(coords[i]) for i in idx]
+
+class FFmpegWriter:
+	"""Pipes raw BGR frames into a single ffmpeg process that encodes H.264 and muxes the AAC audio in the same pass"""
+
+	def __init__(self, outfile, fps, size, audio_path, crf=18, preset='veryfast'):
+		frame_w, frame_h = size
+		command = ['ffmpeg', '-y', '-loglevel', 'error',
+					'-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '{}x{}'.format(frame_w, frame_h), '-r', str(fps), '-i', '-',
+					'-i', audio_path, '-map', '0:v', '-map', '1:a:0',
+					'-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', # yuv420p needs even dimensions
+					'-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p',
+					'-c:a', 'aac', '-b:a', '192k', '-shortest', '-movflags', '+faststart', outfile]
+		self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+	def write(self, frame):
+		self.process.stdin.write(frame.tobytes())
+
+	def release(self):
+		self.process.stdin.close()
+		if self.process.wait() != 0:
+			raise RuntimeError('ffmpeg failed to encode the output (exit code {})'.format(self.process.returncode))
+
+	def abort(self):
+		self.process.kill()
+		self.process.wait()
+
+class AviWriter:
+	"""The original output path: a DIVX AVI in the scratch directory, muxed with the audio by a second ffmpeg run"""
+
+	def __init__(self, outfile, fps, size, audio_path, workdir):
+		self.outfile, self.audio_path = outfile, audio_path
+		self.avi_path = path.join(workdir, 'result.avi')
+		self.out = cv2.VideoWriter(self.avi_path, cv2.VideoWriter_fourcc(*'DIVX'), fps, size)
+
+	def write(self, frame):
+		self.out.write(frame)
+
+	def release(self):
+		self.out.release()
+		subprocess.check_call(['ffmpeg', '-y', '-i', self.audio_path, '-i', self.avi_path, '-strict', '-2', '-q:v', '1', self.outfile])
+
+	def abort(self):
+		self.out.release()
+
+def open_writer(args, fps, size, audio_path, workdir):
+	if args.legacy_avi:
+		return AviWriter(args.outfile, fps, size, audio_path, workdir)
+	return FFmpegWriter(args.outfile, fps, size, audio_path, crf=args.crf, preset=args.x264_preset)
 
 mel_step_size = 16
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
@@ -178,50 +386,77 @@ def load_model(path):
 	model = model.to(device)
 	return model.eval()
 
+def infer(args, model=None, detector=None):
+	"""Run one lip-sync job in its own scratch directory; model and detector are loaded if not given.
+
+	The directory is removed afterwards unless --keep_tmp is set; a failed run's
+	is renamed to <dir>_failed and only the last --keep_failed of those are kept.
+	"""
+	os.makedirs(args.tmp_dir, exist_ok=True)
+	workdir = tempfile.mkdtemp(prefix='wav2lip_', dir=args.tmp_dir)
+	try:
+		run(args, workdir, model, detector)
+	except BaseException:
+		if not args.keep_tmp:
+			failed = workdir + '_failed'
+			os.rename(workdir, failed)
+			workdir = failed
+			prune_failed(args.tmp_dir, args.keep_failed)
+		if path.isdir(workdir):
+			print('Run failed, scratch files kept in {}'.format(workdir))
+		raise
+	if not args.keep_tmp:
+		shutil.rmtree(workdir, ignore_errors=True)
+	return args.outfile
+
+def prune_failed(tmp_dir, keep):
+	"""Remove the scratch folders of all but the `keep` most recent failed runs"""
+	def mtime(workdir):
+		try:
+			return path.getmtime(workdir)
+		except OSError:
+			return 0
+	failed = sorted(glob(path.join(tmp_dir, 'wav2lip_*_failed')), key=mtime, reverse=True)
+	for workdir in failed[max(0, keep):]:
+		shutil.rmtree(workdir, ignore_errors=True)
+
 def main():
-	if not os.path.isfile(args.face):
+	infer(build_args())
+
+def run(args, workdir, model=None, detector=None):
+	"""Lip-sync in two streaming passes over the source: detect faces, then generate and write.
+
+	Only the face boxes are kept between passes, so peak memory depends on the
+	batch sizes rather than on the length of the clip. With --pack both passes
+	are skipped and the pre-cut faces are read straight from the pack.
+	"""
+	if args.pack:
+		pack = load_pack(args.pack)
+		if pack['img_size'] != args.img_size:
+			raise ValueError('Avatar pack {} holds {}px faces, the model needs {}px'.format(args.pack, pack['img_size'], args.img_size))
+		fps = pack['fps']
+
+	elif not args.face or not os.path.isfile(args.face):
 		raise ValueError('--face argument must be a valid path to video/image file')
 
 	elif args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
-		full_frames = [cv2.imread(args.face)]
+		still = cv2.imread(args.face)
 		fps = args.fps
 
 	else:
 		video_stream = cv2.VideoCapture(args.face)
 		fps = video_stream.get(cv2.CAP_PROP_FPS)
-
-		print('Reading video frames...')
-
-		full_frames = []
-		while 1:
-			still_reading, frame = video_stream.read()
-			if not still_reading:
-				video_stream.release()
-				break
-			if args.resize_factor > 1:
-				frame = cv2.resize(frame, (frame.shape[1]//args.resize_factor, frame.shape[0]//args.resize_factor))
-
-			if args.rotate:
-				frame = cv2.rotate(frame, cv2.cv2.ROTATE_90_CLOCKWISE)
-
-			y1, y2, x1, x2 = args.crop
-			if x2 == -1: x2 = frame.shape[1]
-			if y2 == -1: y2 = frame.shape[0]
-
-			frame = frame[y1:y2, x1:x2]
-
-			full_frames.append(frame)
-
-	print ("Number of frames available for inference: "+str(len(full_frames)))
+		video_stream.release()
+		still = next(read_frames(args)) if args.static else None
 
 	if not args.audio.endswith('.wav'):
 		print('Extracting raw audio...')
-		command = 'ffmpeg -y -i {} -strict -2 {}'.format(args.audio, 'temp/temp.wav')
-
-		subprocess.call(command, shell=True)
-		args.audio = 'temp/temp.wav'
+		wav_path = path.join(workdir, 'temp.wav')
+		subprocess.check_call(['ffmpeg', '-y', '-i', args.audio, '-strict', '-2', wav_path])
+	else:
+		wav_path = args.audio
 
-	wav = audio.load_wav(args.audio, 16000)
+	wav = audio.load_wav(wav_path, 16000)
 	mel = audio.melspectrogram(wav)
 	print(mel.shape)
 
@@ -241,40 +476,62 @@ def main():
 
 	print("Length of mel chunks: {}".format(len(mel_chunks)))
 
-	full_frames = full_frames[:len(mel_chunks)]
-
 	batch_size = args.wav2lip_batch_size
-	gen = datagen(full_frames.copy(), mel_chunks)
+	if args.pack:
+		gen = pack_datagen(pack, mel_chunks, args)
+	else:
+		# Frames past the end of the audio are never used, so they are never decoded
+		if still is not None:
+			open_frames = lambda: iter([still])
+		else:
+			open_frames = lambda: itertools.islice(read_frames(args), len(mel_chunks))
 
-	for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(gen, 
-											total=int(np.ceil(float(len(mel_chunks))/batch_size)))):
-		if i == 0:
-			model = load_model(args.checkpoint_path)
-			print ("Model loaded")
+		if args.box[0] == -1:
+			boxes = face_boxes(open_frames, 1 if still is not None else len(mel_chunks), args, workdir, detector)
+			print ("Number of frames available for inference: "+str(len(boxes)))
+		else:
+			print('Using the specified bounding box instead of face detection...')
+			boxes = None
 
-			frame_h, frame_w = full_frames[0].shape[:-1]
-			out = cv2.VideoWriter('temp/result.avi', 
-									cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
+		if still is not None:
+			box = boxes[0] if boxes is not None else [args.box[2], args.box[0], args.box[3], args.box[1]]
+			gen = static_datagen(still, box, mel_chunks, args)
+		else:
+			gen = datagen(open_frames, boxes, mel_chunks, args)
 
-		img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
-		mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
+	out = None
+	try:
+		for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(gen, 
+												total=int(np.ceil(float(len(mel_chunks))/batch_size)))):
+			if i == 0:
+				if model is None:
+					model = load_model(args.checkpoint_path)
+					print ("Model loaded")
 
-		with torch.no_grad():
-			pred = model(mel_batch, img_batch)
+				frame_h, frame_w = frames[0].shape[:-1]
+				out = open_writer(args, fps, (frame_w, frame_h), wav_path, workdir)
 
-		pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
-		
-		for p, f, c in zip(pred, frames, coords):
-			y1, y2, x1, x2 = c
-			p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+			if not torch.is_tensor(img_batch):
+				img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
+			mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
 
-			f[y1:y2, x1:x2] = p
-			out.write(f)
+			with torch.no_grad():
+				pred = model(mel_batch, img_batch)
 
-	out.release()
+			pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
+			
+			for p, f, c in zip(pred, frames, coords):
+				y1, y2, x1, x2 = c
+				p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+
+				f[y1:y2, x1:x2] = p
+				out.write(f)
+	except BaseException:
+		if out is not None:
+			out.abort()
+		raise
 
-	command = 'ffmpeg -y -i {} -i {} -strict -2 -q:v 1 {}'.format(args.audio, 'temp/result.avi', args.outfile)
-	subprocess.call(command, shell=platform.system() != 'Windows')
+	out.release()
 
 if __name__ == '__main__':
 	main()
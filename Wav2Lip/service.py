@@ -0,0 +1,121 @@
+import argparse, json, os, socketserver, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from inference import build_args, infer, load_detector, load_model, device
+
+class Wav2LipService:
+	"""Keeps the Wav2Lip model and the s3fd face detector loaded and runs (face, audio) jobs against them.
+
+	Loading both models costs several seconds per run; here it happens once.
+	At most `max_concurrent` jobs run at a time (1 by default, so jobs do not
+	compete for GPU memory); further callers wait their turn.
+	"""
+
+	def __init__(self, checkpoint_path, max_concurrent=1, **defaults):
+		self.checkpoint_path = checkpoint_path
+		self.defaults = defaults
+		self.model = load_model(checkpoint_path)
+		self.detector = load_detector()
+		self.slots = threading.BoundedSemaphore(max_concurrent)
+		self.lock = threading.Lock()
+		self.completed = 0
+		self.failed = 0
+
+	def infer(self, face, audio, outfile, **options):
+		"""Lip-sync `face` (video or image) to `audio`, write `outfile` and return its path.
+
+		`face` may be None when options name an avatar pack (pack='packs/anchor').
+		"""
+		argv = ['--checkpoint_path', self.checkpoint_path, '--audio', audio, '--outfile', outfile]
+		if face:
+			argv += ['--face', face]
+		args = build_args(argv, **dict(self.defaults, **options))
+		with self.slots:
+			try:
+				result = infer(args, self.model, self.detector)
+			except Exception:
+				with self.lock:
+					self.failed += 1
+				raise
+		with self.lock:
+			self.completed += 1
+		return result
+
+	def stats(self):
+		return {'device': device, 'completed': self.completed, 'failed': self.failed}
+
+class Handler(BaseHTTPRequestHandler):
+	"""POST /infer with {"face", "audio", "outfile", "options"} (face may be omitted when options has "pack"); GET /health"""
+
+	def _reply(self, status, body):
+		data = json.dumps(body).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self):
+		if self.path != '/health':
+			return self._reply(404, {'error': 'Not found'})
+		self._reply(200, dict(self.server.service.stats(), status='ok'))
+
+	def do_POST(self):
+		if self.path != '/infer':
+			return self._reply(404, {'error': 'Not found'})
+		try:
+			job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+			face, audio, outfile = job.get('face'), job['audio'], job['outfile']
+		except (ValueError, KeyError, TypeError, AttributeError):
+			return self._reply(400, {'error': 'Expected JSON with face (or a pack option), audio and outfile'})
+		start = time.time()
+		try:
+			outfile = self.server.service.infer(face, audio, outfile, **job.get('options', {}))
+		except ValueError as e:
+			return self._reply(400, {'error': str(e)})
+		except Exception as e:
+			return self._reply(500, {'error': str(e)})
+		self._reply(200, {'outfile': outfile, 'seconds': round(time.time() - start, 2)})
+
+	def address_string(self):
+		# Unix socket peers have no address
+		return self.client_address[0] if self.client_address else 'unix'
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+	def get_request(self):
+		request, _ = super().get_request()
+		return request, ('unix', 0)
+
+def serve(service, host='127.0.0.1', port=8765, socket_path=None):
+	if socket_path:
+		if os.path.exists(socket_path):
+			os.remove(socket_path)
+		server = UnixHTTPServer(socket_path, Handler)
+		print('Wav2Lip service listening on unix:{}'.format(socket_path))
+	else:
+		server = ThreadingHTTPServer((host, port), Handler)
+		print('Wav2Lip service listening on http://{}:{}'.format(host, port))
+	server.service = service
+	try:
+		server.serve_forever()
+	finally:
+		server.server_close()
+		if socket_path and os.path.exists(socket_path):
+			os.remove(socket_path)
+
+def main():
+	parser = argparse.ArgumentParser(description='Resident Wav2Lip inference service with models kept loaded')
+	parser.add_argument('--checkpoint_path', type=str, help='Wav2Lip checkpoint to load', required=True)
+	parser.add_argument('--host', type=str, default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--socket', type=str, default=None, help='Listen on this Unix socket instead of TCP')
+	parser.add_argument('--max_concurrent', type=int, default=1, help='Jobs allowed to run at the same time')
+	args = parser.parse_args()
+
+	service = Wav2LipService(args.checkpoint_path, max_concurrent=args.max_concurrent)
+	serve(service, args.host, args.port, args.socket)
+
+if __name__ == '__main__':
+	main()
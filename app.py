@@ -1,16 +1,32 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
+from werkzeug.security import safe_join
 import os
 import json
+import base64
 import time
 import logging
 import requests
 import tweepy
 from groq import Groq
-from datetime import datetime
+from collections import namedtuple
 import threading
 import re
-from newsapi import NewsApiClient
-import subprocess
+import shutil
+import queue
+import uuid
+from jobs import JobQueue, Pipeline, Stage
+from concurrent.futures import Future, ThreadPoolExecutor
+from http_client import get_client, SAFE_RETRY_STATUSES
+from did_poller import DIDPoller, DID_TALKS_URL
+from cache import DiskCache, make_key, normalize_script, tts_cache_key
+from dedup import HeadlineIndex
+from usage import UsageTracker
+from events import EventBus
+from exports import ExportManager, part_path, probe_duration
+from render import ENCODE_PRESETS, RENDER_PRESETS, render_args
+from catalog import AssetCatalog
+from retention import RetentionEngine
+from captions import estimate_word_timings, group_cues, words_from_alignment, write_captions
 
 app = Flask(__name__)
 
@@ -39,12 +55,46 @@ DEFAULT_CONFIG = {
     "settings": {
         "content_niche": "technology",
         "voice_id": "21m00Tcm4TlvDq8ikWAM",  # Default ElevenLabs voice
-        "output_directory": "./media"
+        "output_directory": "./media",
+        "max_backlog": 50,
+        "stage_concurrency": {"news": 2, "script": 2, "audio": 2, "image": 2, "video": 2},
+        "max_pending_renders": 100,
+        "script_cache": {"ttl_hours": 24, "max_entries": 5000},
+        "audio_cache_max_mb": 500,
+        "tts_options": {},
+        "stage_queue_size": 10,
+        "news_page_size": 20,
+        "dedup": {"threshold": 0.7, "max_age_days": 14},
+        "export_workers": None,  # None sizes the ffmpeg pool from the CPU count
+        "export_preset": "balanced",
+        "export_formats": ["shorts_1080"],
+        # Only scratch files are deleted out of the box: Wav2Lip run folders and
+        # unfinished downloads in temp/ (the desktop app keeps its narration
+        # there too). The other policies just report (see /retention/report)
+        # until dry_run is turned off for them
+        "retention": {
+            "interval_minutes": 30,
+            "policies": [
+                {"path": "temp", "max_age_days": 1, "match": ["wav2lip_*", "avatar_pack_*", "*.part", "*.tmp"]},
+                {"path": "scripts", "max_age_days": 30, "dry_run": True},
+                {"path": "media", "max_age_days": 30, "max_gb": 20, "keep_last_n": 10, "keep_published": True,
+                 "dry_run": True},
+                {"path": "output", "max_age_days": 30, "max_gb": 20, "keep_last_n": 10, "keep_published": True,
+                 "dry_run": True}
+            ]
+        }
     }
 }
 
+DEFAULT_API_LIMITS = {
+    "groq": {"daily": 100, "per_minute": 30},
+    "elevenlabs": {"daily": 50, "per_minute": 10},
+    "unsplash": {"daily": 50, "per_minute": 10}
+}
+USAGE_FILE = "config/usage.json"
+
 # Ensure directories exist
-for directory in ['config', 'media', 'logs', 'temp', 'scripts']:
+for directory in ['config', 'media', 'logs', 'temp', 'scripts', 'cache']:
     os.makedirs(directory, exist_ok=True)
 
 # Load configuration
@@ -62,104 +112,257 @@ def load_config():
         return DEFAULT_CONFIG
 
 config = load_config()
+# Let a fronting nginx/Apache stream media files itself when configured to
+app.config['USE_X_SENDFILE'] = config.get("settings", {}).get("use_x_sendfile", False)
+config_lock = threading.Lock()
+# Serializes saves so the newest snapshot is the one that lands on disk
+config_write_lock = threading.Lock()
+
+def save_config():
+    """Write the config atomically so readers never see a half-written file"""
+    with config_write_lock:
+        with config_lock:
+            data = json.dumps(config, indent=4)
+        tmp = f"{CONFIG_FILE}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.replace(tmp, CONFIG_FILE)
+
+http = get_client()
+did_poller = DIDPoller(http)
+download_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="download")
+
+_script_cache_settings = config.get("settings", {}).get("script_cache", DEFAULT_CONFIG["settings"]["script_cache"])
+script_cache = DiskCache(
+    os.path.join("cache", "scripts"),
+    ttl=_script_cache_settings.get("ttl_hours", 24) * 3600,
+    max_entries=_script_cache_settings.get("max_entries", 5000),
+    suffix=".txt",
+    keep_in_memory=True
+)
+audio_cache = DiskCache(
+    os.path.join("cache", "audio"),
+    max_bytes=config.get("settings", {}).get("audio_cache_max_mb", 500) * 1024 * 1024,
+    suffix=".mp3"
+)
+catalog = AssetCatalog(os.path.join("config", "catalog.db"))
+# Pick up files written before the catalog existed (or outside the app) without delaying startup
+threading.Thread(target=catalog.sync_directory, args=(config["settings"]["output_directory"],),
+                 name="catalog-sync", daemon=True).start()
+_retention_settings = config.get("settings", {}).get("retention", DEFAULT_CONFIG["settings"]["retention"])
+retention = RetentionEngine(
+    _retention_settings.get("policies", []),
+    catalog=catalog,
+    interval=_retention_settings.get("interval_minutes", 30) * 60
+)
+retention.start()
+# Character timings for cached speech, under the same keys as audio_cache
+alignment_cache = DiskCache(os.path.join("cache", "alignment"), max_entries=5000, suffix=".json")
+_dedup_settings = config.get("settings", {}).get("dedup", DEFAULT_CONFIG["settings"]["dedup"])
+headline_index = HeadlineIndex(
+    os.path.join("cache", "seen_headlines.jsonl"),
+    threshold=_dedup_settings.get("threshold", 0.7),
+    max_age_days=_dedup_settings.get("max_age_days", 14)
+)
 
-# Global state for progress and control
-progress = {"step": "Idle", "message": "Ready", "files": {}, "topic": ""}
-stop_event = threading.Event()
+def build_usage_tracker():
+    """Limits come from config["api_limits"]; counters from older configs that stored them there are carried over"""
+    configured = config.get("api_limits", {})
+    limits = {}
+    for name in set(DEFAULT_API_LIMITS) | set(configured):
+        merged = dict(DEFAULT_API_LIMITS.get(name, {}), **configured.get(name, {}))
+        limits[name] = {k: merged[k] for k in ("daily", "per_minute") if k in merged}
+    tracker = UsageTracker(USAGE_FILE, limits)
+    for name, legacy in configured.items():
+        if "used" in legacy:
+            tracker.seed(name, legacy["used"], legacy.get("reset_date", ""))
+    return tracker
+
+usage_tracker = build_usage_tracker()
+
+_groq_clients = {}
+_groq_lock = threading.Lock()
+
+def get_groq_client():
+    """Reuse one Groq client (and its connection pool) per API key"""
+    api_key = config["api_keys"]["groq_api_key"]
+    with _groq_lock:
+        if api_key not in _groq_clients:
+            _groq_clients[api_key] = Groq(api_key=api_key, timeout=30, max_retries=3)
+        return _groq_clients[api_key]
+
+IDLE_PROGRESS = {"step": "Idle", "message": "Ready", "files": {}, "topic": ""}
 
 # API Functions
 
+NEWS_CATEGORIES = ["business", "entertainment", "general", "health", "science", "sports", "technology"]
+
+# Compact per-article record produced by batch ingestion
+Article = namedtuple("Article", ["category", "title", "description", "url", "source", "published_at"])
+
+def get_top_headlines(category, page_size):
+    """One NewsAPI top-headlines call; returns the raw articles list (empty on error)"""
+    response = http.get(
+        "https://newsapi.org/v2/top-headlines",
+        headers={"X-Api-Key": config["api_keys"]["news_api_key"]},
+        params={"category": category, "language": "en", "pageSize": page_size}
+    ).json()
+    if response.get('status') != 'ok':
+        logger.error(f"NewsAPI error for {category}: {response.get('message', 'unknown error')}")
+        return []
+    return response.get('articles') or []
+
+def article_news_text(article):
+    return article.title + " - " + (article.description or '')
+
+def fetch_news_batch(categories, page_size=20):
+    """Fetch one page per category and normalize it into Article records, dropping untitled items"""
+    batch = []
+    for category in categories:
+        for raw in get_top_headlines(category, page_size):
+            if not raw.get('title'):
+                continue
+            batch.append(Article(
+                category=category,
+                title=raw['title'],
+                description=raw.get('description') or '',
+                url=raw.get('url'),
+                source=(raw.get('source') or {}).get('name', ''),
+                published_at=raw.get('publishedAt', '')
+            ))
+    return batch
+
 def fetch_trending_news():
-    """Fetch a trending topic and a related news post from NewsAPI"""
-    newsapi = NewsApiClient(api_key=config["api_keys"]["news_api_key"])
+    """Fetch a page of top headlines from NewsAPI and claim the first one we have not covered yet.
+
+    Returns (topic, news_text, article); article is None when there was nothing to claim.
+    """
     category = config.get("settings", {}).get("content_category", "technology")
-    response = newsapi.get_top_headlines(category=category, language='en', page_size=1)
-    if response['status'] == 'ok' and response['articles']:
-        article = response['articles'][0]
-        trending_topic = f"{category.capitalize()} News"
-        news_text = article['title'] + " - " + article['description']
-    else:
-        trending_topic = f"{category.capitalize()} News"
-        news_text = f"No recent news found for {category}. Reporting trending topic instead."
-    return trending_topic, news_text
+    page_size = config.get("settings", {}).get("news_page_size", 20)
+    trending_topic = f"{category.capitalize()} News"
+    articles = fetch_news_batch([category], page_size)
+    if articles:
+        for article in articles:
+            if headline_index.claim(article.title, article.url):
+                return trending_topic, article_news_text(article), article
+        raise Exception(f"All {len(articles)} top {category} headlines were already covered")
+    news_text = f"No recent news found for {category}. Reporting trending topic instead."
+    return trending_topic, news_text, None
+
+ANCHOR_MODEL = "llama3-8b-8192"
+ANCHOR_MAX_TOKENS = 100
+ANCHOR_PROMPT = (
+    "Rephrase the following news text into a concise, engaging 30-second script (3-4 sentences) i do not want placeholders for music/narrators, ONLY GIVE TEXT TO BE SPOKEN. also dont say Here is your consise segment,ONLY TALK ABOUT NEWS DIRECTLY"
+    "as if a news anchor is reporting it on air. Topic: {topic}\n\nText: {news_text}"
+)
 
 def rephrase_as_anchor(topic, news_text):
-    """Rephrase news text into a 30-second anchor-style script using Groq"""
-    client = Groq(api_key=config["api_keys"]["groq_api_key"])
-    prompt = (
-        f"Rephrase the following news text into a concise, engaging 30-second script (3-4 sentences) i do not want placeholders for music/narrators, ONLY GIVE TEXT TO BE SPOKEN. also dont say Here is your consise segment,ONLY TALK ABOUT NEWS DIRECTLY"
-        f"as if a news anchor is reporting it on air. Topic: {topic}\n\nText: {news_text}"
-    )
+    """Rephrase news text into a 30-second anchor-style script using Groq, reusing cached scripts"""
+    key = make_key(ANCHOR_MODEL, ANCHOR_MAX_TOKENS, ANCHOR_PROMPT, topic, news_text)
+    cached = script_cache.get_text(key)
+    if cached is not None:
+        logger.info(f"Script cache hit for topic: {topic}")
+        return cached
+    track_api_usage("groq")
+    client = get_groq_client()
+    prompt = ANCHOR_PROMPT.format(topic=topic, news_text=news_text)
     response = client.chat.completions.create(
         messages=[{"role": "user", "content": prompt}],
-        model="llama3-8b-8192",
-        max_tokens=100
+        model=ANCHOR_MODEL,
+        max_tokens=ANCHOR_MAX_TOKENS
     )
-    return response.choices[0].message.content.strip()
+    script = response.choices[0].message.content.strip()
+    script_cache.put_text(key, script)
+    return script
 
 def generate_audio(script, output_path):
-    """Generate audio from script using ElevenLabs"""
-    response = requests.post(
-        f"https://api.elevenlabs.io/v1/text-to-speech/{config['settings']['voice_id']}",
+    """Generate audio from script using ElevenLabs, reusing cached audio for identical requests.
+
+    Returns the character alignment ElevenLabs sent with the speech, or None if
+    the audio came from the cache without one.
+    """
+    voice_id = config['settings']['voice_id']
+    options = config["settings"].get("tts_options", {})
+    key = tts_cache_key(voice_id, script, options)
+    if audio_cache.get_file(key, output_path):
+        logger.info(f"Audio cache hit for {output_path}")
+        alignment = alignment_cache.get_text(key)
+        return json.loads(alignment) if alignment else None
+    track_api_usage("elevenlabs")
+    response = http.post(
+        f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/with-timestamps",
         headers={"xi-api-key": config["api_keys"]["elevenlabs_api_key"]},
-        json={"text": script}
+        json={"text": normalize_script(script), **options}
     )
     if response.status_code == 200:
+        data = response.json()
         with open(output_path, "wb") as f:
-            f.write(response.content)
-        return True
+            f.write(base64.b64decode(data["audio_base64"]))
+        audio_cache.put_file(key, output_path)
+        alignment = data.get("alignment")
+        if alignment:
+            alignment_cache.put_text(key, json.dumps(alignment))
+        return alignment
     raise Exception(f"ElevenLabs error: {response.status_code} - {response.text}")
 
+def generate_captions(script, audio_path, captions_path, alignment=None):
+    """Write burn-in captions for the narration, timed from the TTS alignment or estimated from the audio length"""
+    if alignment:
+        words = words_from_alignment(alignment)
+    else:
+        words = estimate_word_timings(normalize_script(script), probe_duration(audio_path))
+    if not words:
+        return None
+    return write_captions(captions_path, group_cues(words))
+
 def track_api_usage(api_name):
-    """Track API usage and check if we're within limits"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    if "api_limits" not in config:
-        config["api_limits"] = {
-            "groq": {"daily": 100, "used": 0, "reset_date": ""},
-            "elevenlabs": {"daily": 50, "used": 0, "reset_date": ""},
-            "unsplash": {"daily": 50, "used": 0, "reset_date": ""}
-        }
-    if config["api_limits"][api_name]["reset_date"] != today:
-        config["api_limits"][api_name]["used"] = 0
-        config["api_limits"][api_name]["reset_date"] = today
-    if config["api_limits"][api_name]["used"] >= config["api_limits"][api_name]["daily"]:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
-        raise Exception(f"{api_name.capitalize()} API daily limit reached ({config['api_limits'][api_name]['daily']} calls)")
-    config["api_limits"][api_name]["used"] += 1
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=4)
-    return config["api_limits"][api_name]
+    """Track API usage and check if we're within limits, waiting briefly if rate limited"""
+    return usage_tracker.acquire(api_name, block=True)
 
 def fetch_image(topic, output_path, source="unsplash", custom_image_path=None):
     """Get an image from various sources"""
     if source == "custom" and custom_image_path:
-        with open(custom_image_path, "rb") as src, open(output_path, "wb") as dst:
-            dst.write(src.read())
+        shutil.copyfile(custom_image_path, output_path)
         return True
     elif source == "unsplash":
-        response = requests.get(
+        track_api_usage("unsplash")
+        response = http.get(
             "https://api.unsplash.com/photos/random",
             params={"query": topic, "client_id": config["api_keys"]["unsplash_api_key"]}
         )
         if response.status_code == 200:
             image_url = response.json()["urls"]["regular"]
-            image_data = requests.get(image_url).content
-            with open(output_path, "wb") as f:
-                f.write(image_data)
+            http.download(image_url, output_path)
             return True
         raise Exception(f"Unsplash error: {response.status_code} - {response.text}")
     elif source == "ai":
         placeholder_url = f"https://via.placeholder.com/800x600.png?text={topic.replace(' ', '+')}"
-        image_data = requests.get(placeholder_url).content
-        with open(output_path, "wb") as f:
-            f.write(image_data)
+        http.download(placeholder_url, output_path)
         return True
 
-def generate_avatar_video(script_content, video_path):
-    """Generate avatar video using D-ID API."""
+def _log_did_error(e):
+    if isinstance(e, requests.exceptions.RequestException):
+        logger.error(f"D-ID API error: {e} - Response: {e.response.text if e.response is not None else 'No response'}")
+    else:
+        logger.error(f"D-ID error: {e}")
+
+def _download_did_video(status_data, video_path):
+    video_url = status_data.get("result_url")
+    if not video_url:
+        logger.error("Missing 'result_url' in D-ID status")
+        return False
+    logger.info(f"Downloading video from {video_url}")
+    http.download(video_url, video_path)
+    return True
+
+def submit_avatar_video(script_content, video_path):
+    """Start a D-ID render and return a Future that resolves to True once the video is saved.
+
+    The caller's thread is only held for the create request; status polling is
+    handled by the shared did_poller and the download by download_executor.
+    """
+    result = Future()
     did_api_key = config["api_keys"]["d_id_api_key"]
-    did_api_url = "https://api.d-id.com/talks"
     headers = {
         "Authorization": f"Basic {did_api_key}",
         "Content-Type": "application/json",
@@ -177,128 +380,294 @@ def generate_avatar_video(script_content, video_path):
 
     try:
         logger.info(f"D-ID API Request: {json.dumps(data, indent=2)}")
-        response = requests.post(did_api_url, headers=headers, json=data)
+        response = http.post(DID_TALKS_URL, headers=headers, json=data, retry_on=SAFE_RETRY_STATUSES)
         logger.info(f"D-ID API Response Status: {response.status_code}")
         if response.status_code != 201:
             logger.error(f"D-ID Response Body: {response.text}")
         response.raise_for_status()
         response_data = response.json()
         logger.info(f"D-ID API Response: {json.dumps(response_data, indent=2)}")
-        
-        video_id = response_data.get("id")
-        if not video_id:
-            logger.error("Missing 'id' in D-ID response")
-            return False
-        
-        status_url = f"https://api.d-id.com/talks/{video_id}"
-        for attempt in range(30):
-            time.sleep(10)
-            status_response = requests.get(status_url, headers=headers)
-            logger.info(f"D-ID Status (Attempt {attempt + 1}): {status_response.status_code}")
-            if status_response.status_code != 200:
-                logger.error(f"D-ID Status Response Body: {status_response.text}")
-            status_response.raise_for_status()
-            status_data = status_response.json()
-            logger.info(f"D-ID Status Data: {json.dumps(status_data, indent=2)}")
-            if status_data["status"] == "done":
-                video_url = status_data.get("result_url")
-                if not video_url:
-                    logger.error("Missing 'result_url' in D-ID status")
-                    return False
-                logger.info(f"Downloading video from {video_url}")
-                video_data = requests.get(video_url).content
-                with open(video_path, "wb") as f:
-                    f.write(video_data)
-                return True
-            elif status_data["status"] in ["error", "rejected"]:
-                logger.error(f"D-ID processing failed: {status_data.get('error', 'Unknown error')}")
-                return False
-        logger.error("D-ID video generation timed out after 5 minutes")
-        return False
-    
-    except requests.exceptions.RequestException as e:
-        logger.error(f"D-ID API error: {e} - Response: {e.response.text if e.response else 'No response'}")
-        return False
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-        return False
+        _log_did_error(e)
+        result.set_result(False)
+        return result
 
-# Process for generating assets
-def generate_assets(topic=None):
-    global progress
-    try:
-        progress["step"] = "Fetching News"
-        progress["message"] = "Fetching trending news from X..."
-        trending_topic, news_text = fetch_trending_news() if not topic else (topic, f"Manual topic: {topic}")
-        progress["topic"] = trending_topic
-        progress["message"] = f"Found news for topic: {trending_topic}"
-        time.sleep(1)
-
-        if stop_event.is_set():
-            return
+    video_id = response_data.get("id")
+    if not video_id:
+        logger.error("Missing 'id' in D-ID response")
+        result.set_result(False)
+        return result
 
-        timestamp = int(time.time())
-        base_filename = f"{trending_topic.lower().replace(' ', '_')}_{timestamp}"
-        news_folder = os.path.join(config["settings"]["output_directory"], re.sub(r'[^\w\s-]', '', trending_topic).strip().replace(' ', '_'))
-        os.makedirs(news_folder, exist_ok=True)
-
-        progress["step"] = "Script"
-        progress["message"] = "Rephrasing as news anchor script with Groq..."
-        script_content = rephrase_as_anchor(trending_topic, news_text)
-        script_path = os.path.join(news_folder, f"{base_filename}.txt")
-        with open(script_path, "w", encoding="utf-8") as f:
-            f.write(script_content)
-        progress["message"] = f"Script saved to {script_path}"
-        progress["files"]["script"] = os.path.relpath(script_path, '.')
-        time.sleep(1)
-
-        if stop_event.is_set():
+    def download(status_data):
+        try:
+            result.set_result(_download_did_video(status_data, video_path))
+        except Exception as e:
+            _log_did_error(e)
+            result.set_result(False)
+
+    def on_status(render):
+        if render.exception() is not None:
+            _log_did_error(render.exception())
+            result.set_result(False)
             return
+        logger.info(f"D-ID Status Data: {json.dumps(render.result(), indent=2)}")
+        download_executor.submit(download, render.result())
 
-        progress["step"] = "Video"
-        progress["message"] = "Generating avatar video with D-ID..."
-        video_path = os.path.join(news_folder, f"{base_filename}.mp4")
-        if generate_avatar_video(script_content, video_path):
-            progress["message"] = f"Video saved to {video_path}"
-            progress["files"]["video"] = os.path.relpath(video_path, '.')  # Ensure video path is stored
-        else:
-            progress["message"] = "Video generation failed."
-            raise Exception("Video generation failed.")
+    # Roughly 2.5 spoken words per second
+    expected_seconds = len(script_content.split()) / 2.5
+    did_poller.track(video_id, headers, expected_seconds=expected_seconds).add_done_callback(on_status)
+    return result
 
-        progress["step"] = "Done"
-        progress["message"] = f"News report assets for '{trending_topic}' stored successfully."
+def generate_avatar_video(script_content, video_path):
+    """Generate avatar video using D-ID API, blocking until it is saved."""
+    return submit_avatar_video(script_content, video_path).result()
+
+# Pipeline stages for generating assets. Each stage reads and extends job.data.
+def stage_fetch_news(job):
+    job.update(step="Fetching News", message="Fetching trending news from X...")
+    if "news_text" in job.data:
+        # Batch-ingested jobs arrive with their article already attached
+        trending_topic, news_text = job.topic, job.data["news_text"]
+    elif job.topic:
+        trending_topic, news_text = job.topic, f"Manual topic: {job.topic}"
+    else:
+        trending_topic, news_text, article = fetch_trending_news()
+        if article is not None:
+            job.data["article"] = article._asdict()
+    job.update(topic=trending_topic, message=f"Found news for topic: {trending_topic}")
+
+    timestamp = int(time.time())
+    news_folder = os.path.join(config["settings"]["output_directory"], re.sub(r'[^\w\s-]', '', trending_topic).strip().replace(' ', '_'))
+    os.makedirs(news_folder, exist_ok=True)
+    job.data.update(
+        topic=trending_topic,
+        news_text=news_text,
+        news_folder=news_folder,
+        base_filename=f"{trending_topic.lower().replace(' ', '_')}_{timestamp}_{job.id}"
+    )
 
-    except Exception as e:
-        progress["message"] = f"Error: {str(e)}"
-        logger.error(f"Asset generation error: {e}")
-    finally:
-        stop_event.clear()
+def add_asset(job, kind, path):
+    """Record a generated file in the asset catalog and publish it on the job"""
+    path = os.path.relpath(path, '.')
+    category = job.data.get("article", {}).get("category") or config["settings"].get("content_category")
+    catalog.record(path, kind, topic=job.data.get("topic"), category=category, job_id=job.id)
+    job.add_file(kind, path)
+
+def stage_script(job):
+    job.update(step="Script", message="Rephrasing as news anchor script with Groq...")
+    script_content = rephrase_as_anchor(job.data["topic"], job.data["news_text"])
+    script_path = os.path.join(job.data["news_folder"], f"{job.data['base_filename']}.txt")
+    with open(script_path, "w", encoding="utf-8") as f:
+        f.write(script_content)
+    job.data["script"] = script_content
+    add_asset(job, "script", script_path)
+    job.update(message=f"Script saved to {script_path}")
+
+def stage_audio(job):
+    if not config["api_keys"].get("elevenlabs_api_key"):
+        return
+    job.update(step="Audio", message="Converting script to audio with ElevenLabs...")
+    audio_path = os.path.join(job.data["news_folder"], f"{job.data['base_filename']}.mp3")
+    alignment = generate_audio(job.data["script"], audio_path)
+    add_asset(job, "audio", audio_path)
+    job.update(message=f"Audio saved to {audio_path}")
+    captions_path = os.path.join(job.data["news_folder"], f"{job.data['base_filename']}.ass")
+    if generate_captions(job.data["script"], audio_path, captions_path, alignment):
+        add_asset(job, "captions", captions_path)
+
+def stage_image(job):
+    if not config["api_keys"].get("unsplash_api_key"):
+        return
+    job.update(step="Image", message="Fetching image from Unsplash...")
+    image_path = os.path.join(job.data["news_folder"], f"{job.data['base_filename']}.jpg")
+    fetch_image(job.data["topic"], image_path)
+    add_asset(job, "image", image_path)
+    job.update(message=f"Image saved to {image_path}")
+
+def stage_video(job):
+    """Submit the render and return a Future so the stage worker is free while D-ID renders"""
+    job.update(step="Video", message="Generating avatar video with D-ID...")
+    video_path = os.path.join(job.data["news_folder"], f"{job.data['base_filename']}.mp4")
+    done = Future()
+
+    def on_render(render):
+        if not render.result():
+            job.update(message="Video generation failed.")
+            done.set_exception(Exception("Video generation failed."))
+            return
+        add_asset(job, "video", video_path)
+        job.update(status="done", step="Done", message=f"News report assets for '{job.data['topic']}' stored successfully.")
+        done.set_result(True)
+
+    submit_avatar_video(job.data["script"], video_path).add_done_callback(on_render)
+    return done
+
+def build_pipeline():
+    settings = config.get("settings", {})
+    concurrency = settings.get("stage_concurrency", DEFAULT_CONFIG["settings"]["stage_concurrency"])
+    queue_size = settings.get("stage_queue_size", 10)
+    stages = [
+        Stage("news", stage_fetch_news, concurrency.get("news", 2), settings.get("max_backlog", 50)),
+        Stage("script", stage_script, concurrency.get("script", 2), queue_size),
+        Stage("audio", stage_audio, concurrency.get("audio", 2), queue_size),
+        Stage("image", stage_image, concurrency.get("image", 2), queue_size),
+        Stage("video", stage_video, concurrency.get("video", 2), queue_size,
+              max_pending=settings.get("max_pending_renders", 100)),
+    ]
+    return Pipeline(stages)
+
+event_bus = EventBus(size=2000)
+def on_job_change(job_id, delta):
+    """Publish job progress, and give a failed or cancelled job's headline back so a retry can cover it"""
+    event_bus.publish(job_id, delta)
+    if delta.get("status") in ("error", "cancelled"):
+        job = job_queue.get(job_id)
+        article = job.data.get("article") if job else None
+        if article and headline_index.release(article["title"], article.get("url")):
+            logger.info(f"Released headline claimed by job {job_id}: {article['title']}")
+
+job_queue = JobQueue(build_pipeline(), on_change=on_job_change)
+export_manager = ExportManager(
+    max_workers=config.get("settings", {}).get("export_workers"),
+    max_pending=config.get("settings", {}).get("max_backlog", 50),
+    on_change=event_bus.publish
+)
+
+def current_progress():
+    """Progress of the most recently submitted job, for the single-job dashboard"""
+    job = job_queue.latest()
+    return job.snapshot() if job else dict(IDLE_PROGRESS)
 
 # Routes
 @app.route('/')
 def index():
-    return render_template('index.html', progress=progress)
+    return render_template('index.html', progress=current_progress())
 
 @app.route('/update_category', methods=['POST'])
 def update_category():
     category = request.form.get('category', 'technology')
-    if category not in ["business", "entertainment", "general", "health", "science", "sports", "technology"]:
+    if category not in NEWS_CATEGORIES:
         return jsonify({"error": "Invalid category"}), 400
-    config["settings"]["content_category"] = category
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=4)
+    with config_lock:
+        config["settings"]["content_category"] = category
+    save_config()
     return jsonify({"message": f"Category updated to {category}"})
 
 @app.route('/start', methods=['POST'])
 def start():
-    global progress
     topic = request.form.get('topic', '').strip()
-    if stop_event.is_set():
-        return jsonify({"error": "Process already running"}), 400
-    progress = {"step": "Starting", "message": "Initializing...", "files": {}, "topic": ""}
-    stop_event.clear()
-    threading.Thread(target=generate_assets, args=(topic,), daemon=True).start()
-    return jsonify({"message": "Started"})
+    try:
+        job = job_queue.submit(topic)
+    except queue.Full:
+        return jsonify({"error": "Job backlog is full, try again later"}), 503
+    return jsonify({"message": "Started", "job_id": job.id})
+
+@app.route('/jobs', methods=['GET', 'POST'])
+def jobs():
+    if request.method == 'GET':
+        return jsonify({"jobs": [job.snapshot() for job in job_queue.jobs()], "stats": job_queue.stats()})
+    # Accept repeated `topics` fields or one newline-separated value
+    topics = [t.strip() for value in request.form.getlist('topics') for t in value.splitlines() if t.strip()]
+    if not topics:
+        return jsonify({"error": "No topics provided"}), 400
+    queued, rejected = [], []
+    for topic in topics:
+        try:
+            queued.append(job_queue.submit(topic).id)
+        except queue.Full:
+            rejected.append(topic)
+    status = 202 if queued else 503
+    return jsonify({"message": f"Queued {len(queued)} job(s)", "job_ids": queued, "rejected": rejected}), status
+
+@app.route('/ingest', methods=['POST'])
+def ingest():
+    """Fetch a page of headlines per category in one call each and queue a job per unseen article"""
+    categories = request.form.getlist('categories') or [config.get("settings", {}).get("content_category", "technology")]
+    invalid = [c for c in categories if c not in NEWS_CATEGORIES]
+    if invalid:
+        return jsonify({"error": f"Invalid categories: {', '.join(invalid)}"}), 400
+    page_size = min(100, max(1, request.form.get('page_size', config.get("settings", {}).get("news_page_size", 20), type=int)))
+
+    queued, duplicates, rejected = [], 0, 0
+    for article in fetch_news_batch(categories, page_size):
+        if not headline_index.claim(article.title, article.url):
+            duplicates += 1
+            continue
+        try:
+            job = job_queue.submit(f"{article.category.capitalize()} News", news_text=article_news_text(article), article=article._asdict())
+        except queue.Full:
+            headline_index.release(article.title, article.url)
+            rejected += 1
+            continue
+        queued.append(job.id)
+    return jsonify({
+        "message": f"Queued {len(queued)} job(s) from {len(categories)} categor{'y' if len(categories) == 1 else 'ies'}",
+        "job_ids": queued,
+        "duplicates": duplicates,
+        "rejected": rejected
+    }), 202 if queued else 200
+
+@app.route('/pipeline/stats')
+def pipeline_stats():
+    stats = job_queue.stats()
+    stats["pending_renders"] = did_poller.pending()
+    stats["exports"] = export_manager.stats()
+    return jsonify(stats)
+
+@app.route('/usage')
+def api_usage():
+    return jsonify(usage_tracker.snapshot())
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({"scripts": script_cache.stats(), "audio": audio_cache.stats()})
+
+@app.route('/catalog')
+def catalog_list():
+    """Page through cataloged assets (newest first), or the most recent jobs with group=job"""
+    per_page = min(200, max(1, request.args.get('per_page', 50, type=int)))
+    page = max(1, request.args.get('page', 1, type=int))
+    if request.args.get('group') == 'job':
+        return jsonify({"jobs": catalog.recent_jobs(per_page)})
+    items, total = catalog.query(
+        limit=per_page, offset=(page - 1) * per_page,
+        kind=request.args.get('kind'), topic=request.args.get('topic'),
+        category=request.args.get('category'), job_id=request.args.get('job_id'),
+        search=request.args.get('q')
+    )
+    return jsonify({"items": items, "total": total, "page": page, "per_page": per_page})
+
+@app.route('/catalog/publish', methods=['POST'])
+def catalog_publish():
+    path = request.form.get('path', '')
+    published = request.form.get('published', 'true').lower() != 'false'
+    if not catalog.mark_published(path, published):
+        return jsonify({"error": "Unknown asset"}), 404
+    return jsonify({"message": "Updated", "path": path, "published": published})
+
+@app.route('/retention/report')
+def retention_report():
+    """Dry run: what the retention policies would delete right now, plus the last real sweep"""
+    report = retention.run_once(dry_run=True)
+    report["last_sweep"] = retention.last_report
+    return jsonify(report)
+
+@app.route('/retention/run', methods=['POST'])
+def retention_run():
+    return jsonify(retention.run_once())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.snapshot())
+
+@app.route('/jobs/<job_id>/stop', methods=['POST'])
+def stop_job(job_id):
+    if not job_queue.stop(job_id):
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({"message": "Stopping"})
 
 @app.route('/share', methods=['POST'])
 def share_content():
@@ -347,52 +716,154 @@ def upload_image():
 
 @app.route('/stop', methods=['POST'])
 def stop():
-    stop_event.set()
-    progress["message"] = "Stopping..."
+    job_queue.stop_all()
     return jsonify({"message": "Stopping"})
 
 @app.route('/progress')
 def get_progress():
-    return jsonify(progress)
+    return jsonify(current_progress())
+
+def _sse(event, data, event_id=None):
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return f"id: {event_id}\n{message}" if event_id is not None else message
+
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of per-job progress deltas.
+
+    New clients (and clients that fell out of the ring buffer) first get a
+    `snapshot` event with every tracked job; after that only `progress` deltas
+    are sent. Reconnecting browsers resume via the Last-Event-ID header.
+    """
+    job_filter = request.args.get('job')
+    last_id = request.headers.get('Last-Event-ID', request.args.get('last_id', ''))
+    last_id = int(last_id) if last_id.isdigit() else None
+
+    def snapshot():
+        current = event_bus.last_id
+        jobs = [job.snapshot() for job in job_queue.jobs() if not job_filter or job.id == job_filter]
+        return current, _sse("snapshot", {"jobs": jobs}, current)
+
+    def stream():
+        nonlocal last_id
+        yield "retry: 3000\n\n"
+        if last_id is None or event_bus.since(last_id) is None:
+            last_id, message = snapshot()
+            yield message
+        while True:
+            pending = event_bus.wait(last_id, timeout=15)
+            if pending is None:
+                last_id, message = snapshot()
+                yield message
+                continue
+            if not pending:
+                yield ": keep-alive\n\n"
+                continue
+            for event in pending:
+                last_id = event["id"]
+                if job_filter and event["job_id"] != job_filter:
+                    continue
+                yield _sse("progress", {"job_id": event["job_id"], "delta": event["delta"]}, event["id"])
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Generated assets carry a unix timestamp (and job id) in their name and are never rewritten
+IMMUTABLE_ASSET = re.compile(r"_\d{10}(_[0-9a-f]{12})?\.\w+$")
+MEDIA_ROOTS = ['media', 'output', 'scripts', 'temp']
+
+def media_roots():
+    roots = MEDIA_ROOTS + [config["settings"]["output_directory"]]
+    return {os.path.realpath(os.path.join(app.root_path, root)) for root in roots}
 
 @app.route('/files/<path:filename>')
 def serve_file(filename):
-    file_path = os.path.join(app.root_path, filename)
-    base_dir = os.path.dirname(file_path)
-    file_name = os.path.basename(file_path)
-    if os.path.exists(file_path):
-        return send_from_directory(base_dir, file_name)
-    return "File not found", 404
+    """Serve generated media with Range, ETag/Last-Modified revalidation and long-lived caching.
+
+    Only files under the media directories are reachable, and unfinished
+    downloads (.part/.tmp) are never served.
+    """
+    file_path = safe_join(app.root_path, filename)
+    if file_path is None or file_path.endswith(('.part', '.tmp')):
+        return "File not found", 404
+    real_path = os.path.realpath(file_path)
+    if not any(os.path.commonpath([real_path, root]) == root for root in media_roots()):
+        return "File not found", 404
+    try:
+        # conditional=True gives byte ranges and 304s; the body goes out through
+        # wsgi.file_wrapper (sendfile under most WSGI servers) or X-Sendfile if enabled
+        response = send_file(real_path, conditional=True, etag=True)
+    except (FileNotFoundError, IsADirectoryError):
+        return "File not found", 404
+    if IMMUTABLE_ASSET.search(real_path):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/export_mp4', methods=['POST'])
 def export_mp4():
+    """Queue an MP4 render on the export pool; progress arrives on /events or /exports/<id>.
+
+    Renders either a still image with an audio track or an existing video (the
+    D-ID output) into every requested format in a single ffmpeg pass, burning in
+    the job's captions file if one is given.
+    """
     image_path = request.form.get('image', '')
     audio_path = request.form.get('audio', '')
+    video_path = request.form.get('video', '')
+    captions_path = request.form.get('captions', '') or None
+    settings = config["settings"]
+    preset = request.form.get('preset') or settings.get("export_preset", "balanced")
+    formats = request.form.getlist('formats') or settings.get("export_formats", ["shorts_1080"])
 
-    if not all([image_path, audio_path]):
+    if not video_path and not all([image_path, audio_path]):
         return jsonify({"error": "Missing required files"}), 400
+    if preset not in ENCODE_PRESETS:
+        return jsonify({"error": f"Unknown preset, expected one of: {', '.join(ENCODE_PRESETS)}"}), 400
+    invalid = [f for f in formats if f not in RENDER_PRESETS]
+    if invalid:
+        return jsonify({"error": f"Unknown formats: {', '.join(invalid)}"}), 400
+
+    timestamp = int(time.time())
+    token = uuid.uuid4().hex[:12]
+    outputs = [(name, os.path.join(settings["output_directory"], f"news_short_{name}_{timestamp}_{token}.mp4"))
+               for name in dict.fromkeys(formats)]
+    output_paths = [path for _, path in outputs]
+    # ffmpeg writes .part files that the export manager renames once they are complete
+    outputs = [(name, part_path(path)) for name, path in outputs]
+    if video_path:
+        ffmpeg_args = render_args(video_path, outputs, encode=preset, subtitles=captions_path,
+                                  threads=export_manager.ffmpeg_threads)
+    else:
+        ffmpeg_args = render_args(image_path, outputs, audio=audio_path, still=True, encode=preset,
+                                  subtitles=captions_path, threads=export_manager.ffmpeg_threads)
+    job = job_queue.get(request.form.get('job_id', '')) or job_queue.latest()
+
+    def on_done(export):
+        topic, job_id = (job.data.get("topic"), job.id) if job else (None, None)
+        for path in export.outputs:
+            catalog.record(os.path.relpath(path, '.'), "video", topic=topic, job_id=job_id)
+        if job:
+            job.add_file("video", os.path.relpath(export.output_path, '.'))  # Update progress with video path
 
     try:
-        timestamp = int(time.time())
-        output_filename = f"news_short_{timestamp}.mp4"
-        output_path = os.path.join(config["settings"]["output_directory"], output_filename)
-        ffmpeg_cmd = [
-            "ffmpeg", "-y",
-            "-loop", "1", "-i", image_path,
-            "-i", audio_path,
-            "-c:v", "libx264", "-tune", "stillimage", "-c:a", "aac",
-            "-b:a", "192k", "-pix_fmt", "yuv420p",
-            "-shortest", output_path
-        ]
-        subprocess.run(ffmpeg_cmd, check=True)
-        progress["files"]["video"] = os.path.relpath(output_path, '.')  # Update progress with video path
-        return jsonify({
-            "message": "MP4 created successfully",
-            "path": output_path
-        })
-    except Exception as e:
-        logger.error(f"Error creating MP4: {e}")
-        return jsonify({"error": str(e)}), 500
+        export = export_manager.submit(ffmpeg_args, output_paths, probe=video_path or audio_path, on_done=on_done)
+    except queue.Full:
+        return jsonify({"error": "Export backlog is full, try again later"}), 503
+    return jsonify({
+        "message": "MP4 export queued",
+        "export_id": export.id,
+        "path": output_paths[0],
+        "outputs": output_paths
+    }), 202
+
+@app.route('/exports/<export_id>')
+def export_status(export_id):
+    export = export_manager.get(export_id)
+    if export is None:
+        return jsonify({"error": "Unknown export"}), 404
+    return jsonify(export.snapshot())
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
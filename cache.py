@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("shorts_generator")
+
+
+def make_key(*parts):
+    """Content address for a cache entry: SHA-256 over the JSON-encoded parts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def normalize_script(text):
+    """Collapse whitespace so formatting-only differences map to the same TTS output"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def tts_cache_key(voice_id, script, options=None):
+    """Cache key for synthesized speech: voice, normalized script and any model/voice settings"""
+    return make_key("tts", voice_id, normalize_script(script), options or {})
+
+
+class DiskCache:
+    """Persistent content-addressed cache with TTL and LRU eviction by entry count and total bytes.
+
+    Entries live at <directory>/<key[:2]>/<key><suffix>. The index (size, creation
+    time, optionally the value itself) is kept in memory so lookups never scan the
+    directory; it is rebuilt from the files once at startup, with file atime as the
+    recency order and mtime as the creation time.
+    """
+
+    def __init__(self, directory, ttl=None, max_entries=None, max_bytes=None, suffix=".bin", keep_in_memory=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.keep_in_memory = keep_in_memory
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._index = OrderedDict()  # key -> [size, created, value]
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}{self.suffix}")
+
+    def _load(self):
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(self.suffix):
+                    st = entry.stat()
+                    entries.append((st.st_atime, entry.name[:-len(self.suffix)], st.st_size, st.st_mtime))
+        for _, key, size, created in sorted(entries):
+            self._index[key] = [size, created, None]
+            self.total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _drop(self, key):
+        size, _, _ = self._index.pop(key)
+        self.total_bytes -= size
+        try:
+            os.remove(self.path_for(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._index and (
+            (self.max_entries is not None and len(self._index) > self.max_entries)
+            or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            self._drop(next(iter(self._index)))
+
+    def _lookup(self, key):
+        """Return the index entry for key and mark it recently used, or None on a miss"""
+        entry = self._index.get(key)
+        if entry is not None and self._expired(entry[1]):
+            self._drop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._index.move_to_end(key)
+        return entry
+
+    def _touch(self, key, created):
+        # Persist recency in the file atime while keeping mtime as the creation time
+        try:
+            os.utime(self.path_for(key), (time.time(), created))
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Return the cached bytes for key, or None"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return None
+            if entry[2] is not None:
+                return entry[2]
+        try:
+            with open(self.path_for(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                if key in self._index:
+                    self._drop(key)
+            return None
+        self._touch(key, entry[1])
+        if self.keep_in_memory:
+            entry[2] = data
+        return data
+
+    def get_file(self, key, dest):
+        """Copy the cached entry for key to dest; returns False on a miss"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return False
+        try:
+            shutil.copyfile(self.path_for(key), dest)
+        except OSError:
+            with self._lock:
+                if key in self._index:
+                    self._drop(key)
+            return False
+        self._touch(key, entry[1])
+        return True
+
+    def put_file(self, key, src):
+        """Store a copy of the file at src under key"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, path)
+        self._add(key, os.path.getsize(path), None)
+
+    def put(self, key, data):
+        """Store bytes under key, evicting least recently used entries if over budget"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._add(key, len(data), data if self.keep_in_memory else None)
+
+    def _add(self, key, size, value):
+        with self._lock:
+            if key in self._index:
+                self.total_bytes -= self._index.pop(key)[0]
+            self._index[key] = [size, time.time(), value]
+            self.total_bytes += size
+            self._evict()
+
+    def get_text(self, key):
+        data = self.get(key)
+        return data.decode("utf-8") if data is not None else None
+
+    def put_text(self, key, text):
+        self.put(key, text.encode("utf-8"))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            }
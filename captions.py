@@ -0,0 +1,108 @@
+import re
+
+# Weight of the pause after a word ending in punctuation, in characters of speech
+PAUSE_WEIGHTS = {",": 3, ";": 4, ":": 4, ".": 6, "!": 6, "?": 6}
+
+
+def words_from_alignment(alignment):
+    """(word, start, end) timings from ElevenLabs character alignment data"""
+    words = []
+    current, start, end = "", None, None
+    for char, char_start, char_end in zip(alignment["characters"],
+                                          alignment["character_start_times_seconds"],
+                                          alignment["character_end_times_seconds"]):
+        if char.isspace():
+            if current:
+                words.append((current, start, end))
+            current, start = "", None
+            continue
+        if start is None:
+            start = char_start
+        current += char
+        end = char_end
+    if current:
+        words.append((current, start, end))
+    return words
+
+
+def estimate_word_timings(text, duration):
+    """(word, start, end) timings spread over `duration` in proportion to word length.
+
+    Used when the speech has no alignment data (cached audio from before
+    alignment was stored, or another TTS source). Punctuation adds a pause
+    so phrases line up with where a reader would breathe.
+    """
+    words = text.split()
+    if not words or not duration:
+        return []
+    weights = [len(word) + 1 + PAUSE_WEIGHTS.get(word[-1], 0) for word in words]
+    per_unit = duration / sum(weights)
+    timings, position = [], 0.0
+    for word, weight in zip(words, weights):
+        speech = (len(word) + 1) * per_unit
+        timings.append((word, position, position + speech))
+        position += weight * per_unit
+    return timings
+
+
+def group_cues(words, max_words=4, max_chars=24, max_duration=2.5):
+    """Merge word timings into short caption cues, breaking after sentence punctuation"""
+    cues, current = [], []
+    for word, start, end in words:
+        if current:
+            text = " ".join(w for w, _, _ in current + [(word, start, end)])
+            if (len(current) >= max_words or len(text) > max_chars
+                    or end - current[0][1] > max_duration or current[-1][0][-1] in ".!?,;:"):
+                cues.append((current[0][1], current[-1][2], " ".join(w for w, _, _ in current)))
+                current = []
+        current.append((word, start, end))
+    if current:
+        cues.append((current[0][1], current[-1][2], " ".join(w for w, _, _ in current)))
+    return cues
+
+
+def _srt_time(seconds):
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def _ass_time(seconds):
+    cs = int(round(seconds * 100))
+    return f"{cs // 360000:d}:{cs // 6000 % 60:02d}:{cs // 100 % 60:02d}.{cs % 100:02d}"
+
+
+def to_srt(cues):
+    blocks = [f"{i}\n{_srt_time(start)} --> {_srt_time(end)}\n{text}\n"
+              for i, (start, end, text) in enumerate(cues, 1)]
+    return "\n".join(blocks)
+
+
+# Styled for a 1080x1920 frame; libass scales it to the rendered size. The bottom
+# margin keeps captions above the platform UI.
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 1080
+PlayResY: 1920
+WrapStyle: 0
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,84,&H00FFFFFF,&H00FFFFFF,&H00000000,&H80000000,-1,0,0,0,100,100,0,0,1,6,2,2,80,80,420,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def to_ass(cues):
+    lines = [f"Dialogue: 0,{_ass_time(start)},{_ass_time(end)},Default,,0,0,0,,{re.sub(r'[{}]', '', text)}"
+             for start, end, text in cues]
+    return ASS_HEADER + "\n".join(lines) + "\n"
+
+
+def write_captions(path, cues):
+    """Write cues as ASS or SRT depending on the file extension"""
+    content = to_ass(cues) if path.lower().endswith(".ass") else to_srt(cues)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
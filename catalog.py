@@ -0,0 +1,198 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from exports import probe_duration
+
+logger = logging.getLogger("shorts_generator")
+
+MEDIA_KINDS = {
+    ".mp4": "video", ".mov": "video", ".avi": "video",
+    ".mp3": "audio", ".wav": "audio", ".m4a": "audio",
+    ".jpg": "image", ".jpeg": "image", ".png": "image",
+    ".txt": "script", ".ass": "captions", ".srt": "captions",
+}
+# Kinds whose duration is worth probing
+TIMED_KINDS = ("video", "audio")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    topic TEXT,
+    category TEXT,
+    job_id TEXT,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    duration REAL,
+    created_at REAL NOT NULL,
+    modified_at REAL NOT NULL,
+    published INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS assets_kind_created ON assets (kind, created_at);
+CREATE INDEX IF NOT EXISTS assets_created ON assets (created_at);
+CREATE INDEX IF NOT EXISTS assets_topic ON assets (topic, created_at);
+CREATE INDEX IF NOT EXISTS assets_job ON assets (job_id);
+"""
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def kind_for(path):
+    return MEDIA_KINDS.get(os.path.splitext(path)[1].lower())
+
+
+class AssetCatalog:
+    """SQLite index of generated scripts, audio, images and videos.
+
+    Files are recorded as they are written, so listing and searching is an
+    indexed query instead of a directory walk. Size, hash and duration are taken
+    once per file version: re-recording a file whose size and mtime have not
+    changed keeps the stored hash and duration rather than reading it again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def record(self, path, kind=None, topic=None, category=None, job_id=None, sha256=None, duration=None,
+               created_at=None):
+        """Add or refresh the entry for a file that was just written"""
+        path = os.path.normpath(path)
+        kind = kind or kind_for(path) or "other"
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logger.error(f"Cannot catalog {path}: {e}")
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT size, modified_at, sha256, duration FROM assets WHERE path = ?",
+                                     (path,)).fetchone()
+        unchanged = row is not None and row["size"] == st.st_size and row["modified_at"] == st.st_mtime
+        if unchanged:
+            sha256 = sha256 or row["sha256"]
+            duration = duration if duration is not None else row["duration"]
+        else:
+            sha256 = sha256 or file_sha256(path)
+            if duration is None and kind in TIMED_KINDS:
+                duration = probe_duration(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO assets (path, kind, topic, category, job_id, size, sha256, duration, created_at, modified_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(path) DO UPDATE SET
+                       kind = excluded.kind,
+                       topic = COALESCE(excluded.topic, topic),
+                       category = COALESCE(excluded.category, category),
+                       job_id = COALESCE(excluded.job_id, job_id),
+                       size = excluded.size, sha256 = excluded.sha256, duration = excluded.duration,
+                       modified_at = excluded.modified_at""",
+                (path, kind, topic, category, job_id, st.st_size, sha256, duration, created_at or time.time(), st.st_mtime)
+            )
+        return path
+
+    def remove(self, path):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM assets WHERE path = ?", (os.path.normpath(path),))
+
+    def remove_many(self, paths):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM assets WHERE path = ?", [(os.path.normpath(p),) for p in paths])
+
+    def entries_under(self, directory):
+        """{path: (topic, published, job_id)} for every cataloged file below directory"""
+        prefix = os.path.join(os.path.normpath(directory), "")
+        with self._lock:
+            rows = self._conn.execute("SELECT path, topic, published, job_id FROM assets WHERE substr(path, 1, ?) = ?",
+                                      (len(prefix), prefix)).fetchall()
+        return {row["path"]: (row["topic"], bool(row["published"]), row["job_id"]) for row in rows}
+
+    def mark_published(self, path, published=True):
+        with self._lock, self._conn:
+            cursor = self._conn.execute("UPDATE assets SET published = ? WHERE path = ?",
+                                        (int(published), os.path.normpath(path)))
+            return cursor.rowcount > 0
+
+    def _where(self, kind=None, topic=None, category=None, job_id=None, search=None, under=None):
+        clauses, params = [], []
+        if under:
+            prefix = os.path.join(os.path.normpath(under), "")
+            clauses.append("substr(path, 1, ?) = ?")
+            params += [len(prefix), prefix]
+        for column, value in (("kind", kind), ("topic", topic), ("category", category), ("job_id", job_id)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if search:
+            clauses.append("(topic LIKE ? OR path LIKE ?)")
+            params += [f"%{search}%", f"%{search}%"]
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, limit=50, offset=0, **filters):
+        """Newest-first page of assets matching the filters, and the total match count.
+
+        `under` limits the results to files below that directory.
+        """
+        where, params = self._where(**filters)
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM assets{where}", params).fetchone()[0]
+            rows = self._conn.execute(f"SELECT * FROM assets{where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                                      params + [limit, offset]).fetchall()
+        return [dict(row) for row in rows], total
+
+    def recent_jobs(self, limit=10):
+        """Files of the most recent jobs, grouped per job"""
+        with self._lock:
+            jobs = self._conn.execute(
+                """SELECT job_id, MAX(topic) AS topic, MIN(created_at) AS created_at FROM assets
+                   WHERE job_id IS NOT NULL GROUP BY job_id ORDER BY created_at DESC LIMIT ?""", (limit,)
+            ).fetchall()
+            files = self._conn.execute(
+                f"SELECT job_id, kind, path FROM assets WHERE job_id IN ({','.join('?' * len(jobs))}) ORDER BY created_at",
+                [job["job_id"] for job in jobs]
+            ).fetchall() if jobs else []
+        result = {job["job_id"]: dict(job, files={}) for job in jobs}
+        for row in files:
+            result[row["job_id"]]["files"][row["kind"]] = row["path"]
+        return list(result.values())
+
+    def sync_directory(self, directory):
+        """Catalog media under directory that was written without going through record().
+
+        Files in a per-topic subfolder (output/Technology_News/...) get the folder
+        name as their topic; unchanged files already in the catalog are skipped.
+        """
+        with self._lock:
+            known = {row["path"]: (row["size"], row["modified_at"])
+                     for row in self._conn.execute("SELECT path, size, modified_at FROM assets")}
+        added = 0
+        directory = os.path.normpath(directory)
+        for root, _, names in os.walk(directory):
+            topic = os.path.basename(root).replace("_", " ") if os.path.normpath(root) != directory else None
+            for name in names:
+                path = os.path.normpath(os.path.join(root, name))
+                if not kind_for(path):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if known.get(path) != (st.st_size, st.st_mtime):
+                    self.record(path, topic=topic, created_at=st.st_mtime)
+                    added += 1
+        return added
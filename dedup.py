@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger("shorts_generator")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_title(title):
+    """Lowercase, drop the trailing " - Source" NewsAPI appends, strip punctuation and extra spaces"""
+    title = re.sub(r"\s+-\s+[^-]+$", "", title or "")
+    title = re.sub(r"[^\w\s]", " ", title.lower())
+    return re.sub(r"\s+", " ", title).strip()
+
+
+def fingerprint(title):
+    return hashlib.sha1(normalize_title(title).encode("utf-8")).hexdigest()
+
+
+class MinHasher:
+    """MinHash signatures over character shingles, for estimating Jaccard similarity of short texts"""
+
+    def __init__(self, num_perm=64, shingle_size=5, seed=1):
+        self.shingle_size = shingle_size
+        # Deterministic permutation parameters so signatures stay comparable across runs
+        params = hashlib.sha256(f"minhash-{seed}".encode()).digest()
+        self._perms = []
+        for i in range(num_perm):
+            digest = hashlib.sha256(params + i.to_bytes(4, "big")).digest()
+            a = int.from_bytes(digest[:8], "big") % (_MERSENNE_PRIME - 1) + 1
+            b = int.from_bytes(digest[8:16], "big") % _MERSENNE_PRIME
+            self._perms.append((a, b))
+
+    def shingles(self, text):
+        text = f" {text} "
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+                  for s in self.shingles(text)]
+        return [min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes) for a, b in self._perms]
+
+
+class HeadlineIndex:
+    """Persistent record of processed articles with exact and near-duplicate lookup.
+
+    Articles match on URL, on the normalized-title fingerprint, or when the MinHash
+    estimate of title similarity reaches `threshold`. Candidates for the similarity
+    check come from LSH buckets (`bands` bands of the signature), so a lookup is
+    independent of how many headlines have been seen. Entries are appended to a
+    JSON-lines file and expire after `max_age_days`: expired entries stop matching
+    straight away and are dropped from memory and the file every `prune_interval`
+    seconds, so a long-running process does not need a restart to forget them.
+    """
+
+    def __init__(self, path, threshold=0.7, num_perm=64, bands=16, max_age_days=14, prune_interval=3600):
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_age = max_age_days * 86400
+        self.prune_interval = prune_interval
+        self.hasher = MinHasher(num_perm)
+        self._lock = threading.Lock()
+        self._urls = {}
+        self._seen_at = {}
+        self._signatures = {}
+        self._buckets = {}
+        self._pruned_at = time.time()
+        self._load()
+
+    def _band_keys(self, signature):
+        return [(i, tuple(signature[i * self.rows:(i + 1) * self.rows])) for i in range(self.bands)]
+
+    def _index(self, entry):
+        fp = entry["fingerprint"]
+        if entry.get("url"):
+            self._urls[entry["url"]] = fp
+        self._seen_at[fp] = entry.get("seen_at", 0)
+        self._signatures[fp] = entry["minhash"]
+        for band in self._band_keys(entry["minhash"]):
+            self._buckets.setdefault(band, set()).add(fp)
+
+    def _unindex(self, fp):
+        self._seen_at.pop(fp, None)
+        signature = self._signatures.pop(fp, None)
+        for url in [url for url, owner in self._urls.items() if owner == fp]:
+            del self._urls[url]
+        if signature is None:
+            return
+        for band in self._band_keys(signature):
+            members = self._buckets.get(band)
+            if members is not None:
+                members.discard(fp)
+                if not members:
+                    del self._buckets[band]
+
+    def _rewrite(self, keep):
+        """Rewrite the file with only the entries for which keep(entry) is true; returns how many were dropped"""
+        if not os.path.exists(self.path):
+            return 0
+        kept, total = [], 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                total += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if keep(entry):
+                    kept.append(entry)
+        if len(kept) < total:
+            tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for entry in kept:
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp, self.path)
+        return total - len(kept)
+
+    def _load(self):
+        cutoff = time.time() - self.max_age
+
+        def keep(entry):
+            if entry.get("seen_at", 0) < cutoff:
+                return False
+            self._index(entry)
+            return True
+
+        # Compacts away expired or corrupt lines while indexing the rest
+        self._rewrite(keep)
+
+    def _prune(self, now):
+        """Forget expired entries, at most once per prune_interval"""
+        if now - self._pruned_at < self.prune_interval:
+            return
+        self._pruned_at = now
+        cutoff = now - self.max_age
+        for fp in [fp for fp, seen_at in self._seen_at.items() if seen_at < cutoff]:
+            self._unindex(fp)
+        self._rewrite(lambda entry: entry.get("seen_at", 0) >= cutoff)
+
+    def _match(self, title, url, signature, now):
+        cutoff = now - self.max_age
+        if url and url in self._urls and self._seen_at[self._urls[url]] >= cutoff:
+            return True
+        if self._seen_at.get(fingerprint(title), 0) >= cutoff:
+            return True
+        candidates = set()
+        for band in self._band_keys(signature):
+            candidates.update(self._buckets.get(band, ()))
+        for candidate in candidates:
+            if self._seen_at[candidate] < cutoff:
+                continue
+            other = self._signatures[candidate]
+            similarity = sum(1 for x, y in zip(signature, other) if x == y) / len(signature)
+            if similarity >= self.threshold:
+                return True
+        return False
+
+    def seen(self, title, url=None):
+        """True if this article (or a near-duplicate headline) was already processed"""
+        signature = self.hasher.signature(normalize_title(title))
+        with self._lock:
+            return self._match(title, url, signature, time.time())
+
+    def claim(self, title, url=None):
+        """Atomically record the article unless it was seen; returns True if it is new"""
+        signature = self.hasher.signature(normalize_title(title))
+        with self._lock:
+            now = time.time()
+            self._prune(now)
+            if self._match(title, url, signature, now):
+                return False
+            fp = fingerprint(title)
+            # An expired entry for the same headline is replaced, not matched
+            self._unindex(fp)
+            entry = {"url": url, "fingerprint": fp, "minhash": signature,
+                     "title": title, "seen_at": now}
+            self._index(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            return True
+
+    def release(self, title, url=None):
+        """Forget an article claimed by work that then failed, so it can be picked up again"""
+        fp = fingerprint(title)
+        with self._lock:
+            if fp not in self._seen_at:
+                return False
+            self._unindex(fp)
+            self._rewrite(lambda entry: entry.get("fingerprint") != fp)
+            return True
@@ -0,0 +1,105 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger("shorts_generator")
+
+DID_TALKS_URL = "https://api.d-id.com/talks"
+
+
+class DIDRenderError(Exception):
+    """Raised when D-ID reports a failed, rejected or timed out render"""
+
+
+class _Talk:
+    def __init__(self, talk_id, headers, future, first_delay, interval, deadline):
+        self.talk_id = talk_id
+        self.headers = headers
+        self.future = future
+        self.next_poll = time.time() + first_delay
+        self.interval = interval
+        self.deadline = deadline
+        self.attempts = 0
+
+
+class DIDPoller:
+    """Tracks all outstanding D-ID talks from one scheduler thread and resolves a Future per talk"""
+
+    def __init__(self, http, workers=2, batch_size=20, initial_interval=2.0, max_interval=15.0,
+                 backoff=1.5, timeout=300):
+        self.http = http
+        self.batch_size = batch_size
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="did-poll")
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def track(self, talk_id, headers, expected_seconds=None):
+        """Start watching a talk; the returned Future resolves to the final status payload"""
+        future = Future()
+        # Long scripts take longer to render, so there is no point polling them straight away
+        first_delay = self.initial_interval
+        if expected_seconds:
+            first_delay = min(self.max_interval, max(first_delay, expected_seconds * 0.25))
+        talk = _Talk(talk_id, headers, future, first_delay, self.initial_interval, time.time() + self.timeout)
+        with self._cond:
+            self._schedule(talk)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="did-poller", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def _schedule(self, talk):
+        heapq.heappush(self._heap, (talk.next_poll, next(self._counter), talk))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._cond.wait(timeout)
+                due = []
+                while self._heap and self._heap[0][0] <= time.time() and len(due) < self.batch_size:
+                    due.append(heapq.heappop(self._heap)[2])
+            for talk in due:
+                self._executor.submit(self._poll, talk)
+
+    def _poll(self, talk):
+        talk.attempts += 1
+        try:
+            response = self.http.get(f"{DID_TALKS_URL}/{talk.talk_id}", headers=talk.headers)
+            logger.info(f"D-ID Status {talk.talk_id} (Attempt {talk.attempts}): {response.status_code}")
+            if response.status_code != 200:
+                logger.error(f"D-ID Status Response Body: {response.text}")
+            response.raise_for_status()
+            status_data = response.json()
+        except Exception as e:
+            talk.future.set_exception(e)
+            return
+
+        status = status_data.get("status")
+        if status == "done":
+            talk.future.set_result(status_data)
+        elif status in ["error", "rejected"]:
+            talk.future.set_exception(DIDRenderError(f"D-ID processing failed: {status_data.get('error', 'Unknown error')}"))
+        elif time.time() >= talk.deadline:
+            talk.future.set_exception(DIDRenderError(f"D-ID video generation timed out after {self.timeout // 60} minutes"))
+        else:
+            talk.next_poll = time.time() + talk.interval
+            talk.interval = min(self.max_interval, talk.interval * self.backoff)
+            with self._cond:
+                self._schedule(talk)
+                self._cond.notify()
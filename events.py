@@ -0,0 +1,52 @@
+import threading
+from collections import deque
+
+
+class EventBus:
+    """Ring buffer of job progress deltas that Server-Sent Events clients follow and resume from.
+
+    Every published event gets a monotonically increasing id. A client that
+    reconnects with Last-Event-ID gets everything it missed as long as it is still
+    in the buffer; if it fell too far behind, or sends an id this bus never
+    issued (the server restarted), since() returns None and the client should
+    be sent a full snapshot instead.
+    """
+
+    def __init__(self, size=1000):
+        self._events = deque(maxlen=size)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self):
+        with self._cond:
+            return self._last_id
+
+    def publish(self, job_id, delta):
+        with self._cond:
+            self._last_id += 1
+            self._events.append({"id": self._last_id, "job_id": job_id, "delta": delta})
+            self._cond.notify_all()
+            return self._last_id
+
+    def _since(self, last_id):
+        if last_id > self._last_id:
+            # An id from before a server restart; the client needs a fresh snapshot
+            return None
+        if last_id == self._last_id:
+            return []
+        if not self._events or self._events[0]["id"] > last_id + 1:
+            return None
+        # Ids are contiguous, so the offset into the buffer is direct
+        start = last_id + 1 - self._events[0]["id"]
+        return [self._events[i] for i in range(start, len(self._events))]
+
+    def since(self, last_id):
+        with self._cond:
+            return self._since(last_id)
+
+    def wait(self, last_id, timeout=15):
+        """Block until there are events after last_id or the timeout passes"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id != last_id, timeout)
+            return self._since(last_id)
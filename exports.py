@@ -0,0 +1,171 @@
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("shorts_generator")
+
+
+def probe_duration(path):
+    """Media duration in seconds via ffprobe, or None if it cannot be determined"""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", path],
+            capture_output=True, text=True, timeout=30
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def part_path(path):
+    """Where ffmpeg writes an export until it has finished; /files/ never serves these"""
+    return f"{path}.part"
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ExportJob:
+    """One ffmpeg export and its progress"""
+
+    def __init__(self, cmd, outputs, duration=None, probe=None, on_change=None):
+        self.id = f"export-{uuid.uuid4().hex[:12]}"
+        self.cmd = cmd
+        self.outputs = outputs
+        self.duration = duration
+        self.probe = probe
+        self.on_change = on_change
+        self.created_at = time.time()
+        self._lock = threading.Lock()
+        self.state = {
+            "id": self.id,
+            "status": "queued",
+            "progress": 0.0,
+            "path": outputs[0],
+            "outputs": outputs,
+            "error": None,
+        }
+
+    @property
+    def output_path(self):
+        return self.outputs[0]
+
+    def update(self, **fields):
+        with self._lock:
+            delta = {k: v for k, v in fields.items() if self.state.get(k) != v}
+            self.state.update(delta)
+            if delta and self.on_change:
+                self.on_change(self.id, delta)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.state)
+
+    @property
+    def finished(self):
+        return self.state["status"] in ("done", "error")
+
+
+class ExportManager:
+    """Runs ffmpeg exports on a bounded pool sized to the CPU count, off the request thread.
+
+    Each worker supervises one ffmpeg process at a time and parses its
+    `-progress` output. The cores are divided between workers: `ffmpeg_threads`
+    is each export's thread budget, which callers pass on to render_args() so
+    concurrent exports do not oversubscribe the CPU.
+    """
+
+    def __init__(self, max_workers=None, max_pending=50, history=200, on_change=None):
+        cpus = os.cpu_count() or 2
+        self.max_workers = max_workers or max(1, cpus // 2)
+        self.ffmpeg_threads = max(1, cpus // self.max_workers)
+        self.max_pending = max_pending
+        self.history = history
+        self.on_change = on_change
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="export")
+        self._exports = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, cmd, outputs, duration=None, probe=None, on_done=None):
+        """Queue an ffmpeg command (without the leading "ffmpeg") writing the given output paths.
+
+        The command must write each output to part_path(output); the parts are
+        renamed into place only once ffmpeg succeeds, so a finished path is never
+        seen half-written. Progress is reported against `duration` seconds, or the duration of the
+        `probe` file, measured on the worker thread rather than the caller's.
+        Raises queue.Full when the backlog is full.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise queue.Full
+            self._pending += 1
+            export = ExportJob(cmd, outputs, duration, probe, self.on_change)
+            self._exports[export.id] = export
+            self._prune()
+        self._executor.submit(self._run, export, on_done)
+        return export
+
+    def get(self, export_id):
+        with self._lock:
+            return self._exports.get(export_id)
+
+    def exports(self):
+        with self._lock:
+            return list(self._exports.values())
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.max_workers, "ffmpeg_threads": self.ffmpeg_threads, "pending": self._pending}
+
+    def _prune(self):
+        excess = len(self._exports) - self.history
+        if excess <= 0:
+            return
+        for export_id in [e.id for e in self._exports.values() if e.finished][:excess]:
+            del self._exports[export_id]
+
+    def _run(self, export, on_done):
+        try:
+            export.update(status="running")
+            if export.duration is None and export.probe:
+                export.duration = probe_duration(export.probe)
+            cmd = ["ffmpeg", "-y", "-nostats", "-loglevel", "error", "-progress", "pipe:1"] + export.cmd
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            # Drain stderr on the side so a chatty ffmpeg cannot block on a full pipe
+            errors = []
+            reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+            reader.start()
+            for line in process.stdout:
+                key, _, value = line.strip().partition("=")
+                if key in ("out_time_us", "out_time_ms") and export.duration and value.isdigit():
+                    # Both keys are in microseconds despite the name of the second
+                    export.update(progress=round(min(1.0, int(value) / 1e6 / export.duration), 3))
+            process.wait()
+            reader.join()
+            if process.returncode != 0:
+                raise Exception(f"ffmpeg exited with {process.returncode}: {''.join(errors).strip()[-500:]}")
+            for path in export.outputs:
+                os.replace(part_path(path), path)
+            export.update(status="done", progress=1.0)
+            if on_done:
+                on_done(export)
+        except Exception as e:
+            logger.error(f"Export {export.id} failed: {e}")
+            for path in export.outputs:
+                _discard(part_path(path))
+            export.update(status="error", error=str(e))
+        finally:
+            with self._lock:
+                self._pending -= 1
@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger("shorts_generator")
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# For non-idempotent calls (e.g. creating a D-ID talk) only retry when the server clearly refused the request
+SAFE_RETRY_STATUSES = frozenset({429, 503})
+# Methods that may be sent again after a timeout or dropped connection without side effects
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class DownloadError(Exception):
+    """Raised when a download is incomplete or fails checksum verification"""
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0, retry_after=None):
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header when present"""
+    if retry_after:
+        try:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def never_sent(error):
+    """True if a requests exception happened before any of the request reached the server"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # Connection refused, DNS failure and the like: urllib3 could not open a socket
+        return isinstance(getattr(error.args[0], "reason", error.args[0]), NewConnectionError)
+    return False
+
+
+class HttpClient:
+    """Shared requests session with keep-alive pooling, per-host caps, timeouts and retries"""
+
+    def __init__(self, pool_size=20, per_host_limit=8, timeout=(5, 60), max_retries=4,
+                 backoff_base=0.5, backoff_max=30.0):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.per_host_limit = per_host_limit
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slots(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    @staticmethod
+    def _release_when_done(response, slots):
+        """Keep a streamed response's host slot until its body is consumed or it is closed"""
+        lock = threading.Lock()
+        held = [True]
+
+        def release():
+            with lock:
+                if held[0]:
+                    held[0] = False
+                    slots.release()
+
+        def hook(original):
+            def wrapper(*args, **kwargs):
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    release()
+            return wrapper
+
+        response.close = hook(response.close)
+        # urllib3 returns the connection to the pool once the body has been read in full
+        if hasattr(response.raw, "release_conn"):
+            response.raw.release_conn = hook(response.raw.release_conn)
+
+    def request(self, method, url, retry_on=RETRY_STATUSES, idempotent=None, **kwargs):
+        """Send a request, retrying connection errors and `retry_on` statuses with jittered backoff.
+
+        Requests that are not idempotent (by default anything but GET, HEAD,
+        OPTIONS, PUT and DELETE) are only re-sent after errors that happened
+        before the request went out; a read timeout or a dropped connection may
+        mean the server already acted on it. The per-host slot is held while the
+        body is read: for stream=True that is until the response is consumed or
+        closed.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        slots = self._slots(url)
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            slots.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                slots.release()
+                if attempt == self.max_retries or not (idempotent or never_sent(e)):
+                    raise
+                logger.warning(f"{method} {url} failed ({e}), retrying")
+            except BaseException:
+                slots.release()
+                raise
+            else:
+                if kwargs.get("stream"):
+                    self._release_when_done(response, slots)
+                else:
+                    slots.release()
+                if response.status_code not in retry_on or attempt == self.max_retries:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                logger.warning(f"{method} {url} returned {response.status_code}, retrying")
+                response.close()
+            time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def download(self, url, dest, sha256=None, chunk_size=1 << 16, attempts=4, headers=None, **kwargs):
+        """Stream url to dest and return its SHA-256.
+
+        Data is written in chunks to `dest + ".part"` and renamed into place only
+        once complete, so readers never see a partial file. If the connection drops,
+        the download resumes from the bytes already on disk with a Range request.
+        """
+        part = f"{dest}.part"
+        digest = hashlib.sha256()
+        written = 0
+        for attempt in range(attempts):
+            request_headers = dict(headers or {})
+            if written:
+                request_headers["Range"] = f"bytes={written}-"
+            try:
+                with self.get(url, stream=True, headers=request_headers, **kwargs) as response:
+                    response.raise_for_status()
+                    if written and response.status_code != 206:
+                        # Server ignored the Range header; start again from scratch
+                        written = 0
+                        digest = hashlib.sha256()
+                    length = response.headers.get("Content-Length")
+                    expected = written + int(length) if length and length.isdigit() else None
+                    with open(part, "ab" if written else "wb") as f:
+                        for chunk in response.iter_content(chunk_size):
+                            f.write(chunk)
+                            digest.update(chunk)
+                            written += len(chunk)
+                if expected is not None and written < expected:
+                    raise requests.exceptions.ConnectionError(f"connection closed after {written} of {expected} bytes")
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                if attempt == attempts - 1:
+                    self._discard(part)
+                    raise DownloadError(f"Download of {url} failed: {e}")
+                logger.warning(f"Download of {url} interrupted at {written} bytes ({e}), resuming")
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+            except Exception:
+                self._discard(part)
+                raise
+
+        checksum = digest.hexdigest()
+        if sha256 and checksum != sha256.lower():
+            self._discard(part)
+            raise DownloadError(f"Checksum mismatch for {url}: expected {sha256}, got {checksum}")
+        os.replace(part, dest)
+        return checksum
+
+    @staticmethod
+    def _discard(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class AsyncHttpClient:
+    """asyncio counterpart of HttpClient built on aiohttp"""
+
+    def __init__(self, pool_size=100, per_host_limit=8, timeout=60, max_retries=4,
+                 backoff_base=0.5, backoff_max=30.0):
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for AsyncHttpClient. Install it with 'pip install aiohttp'.")
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._session = None
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.per_host_limit)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def request(self, method, url, retry_on=RETRY_STATUSES, idempotent=None, **kwargs):
+        """Send a request and return the response with its body already read.
+
+        As with HttpClient, non-idempotent requests are only re-sent when the
+        connection could not be opened.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        session = await self._get_session()
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    await response.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries or not (idempotent or isinstance(e, aiohttp.ClientConnectorError)):
+                    raise
+                logger.warning(f"{method} {url} failed ({e}), retrying")
+            else:
+                if response.status not in retry_on or attempt == self.max_retries:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                logger.warning(f"{method} {url} returned {response.status}, retrying")
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide HttpClient, creating it on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
@@ -0,0 +1,250 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+logger = logging.getLogger("shorts_generator")
+
+FINISHED_STATUSES = ("done", "error", "cancelled")
+
+
+class Job:
+    """A single short-generation request with its own progress and stop flag"""
+
+    def __init__(self, topic="", on_change=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.topic = topic
+        # Called as on_change(job_id, delta) with only the fields that actually changed
+        self.on_change = on_change
+        self.created_at = time.time()
+        self.stop_event = threading.Event()
+        # Working state handed from one pipeline stage to the next
+        self.data = {}
+        self._lock = threading.Lock()
+        self.progress = {
+            "id": self.id,
+            "status": "queued",
+            "step": "Queued",
+            "message": "Waiting for a free worker...",
+            "files": {},
+            "topic": topic,
+        }
+
+    def update(self, **fields):
+        """Merge fields into the job progress"""
+        with self._lock:
+            delta = {k: v for k, v in fields.items() if self.progress.get(k) != v}
+            self.progress.update(delta)
+            # Published under the lock so listeners see a job's deltas in order
+            if delta and self.on_change:
+                self.on_change(self.id, delta)
+
+    def add_file(self, kind, path):
+        """Record a generated file under progress["files"]"""
+        with self._lock:
+            self.progress["files"][kind] = path
+            if self.on_change:
+                self.on_change(self.id, {"files": {kind: path}})
+
+    def snapshot(self):
+        """Return a copy of the progress that is safe to serialize"""
+        with self._lock:
+            data = dict(self.progress)
+            data["files"] = dict(self.progress["files"])
+        return data
+
+    @property
+    def status(self):
+        return self.progress["status"]
+
+    @property
+    def finished(self):
+        return self.progress["status"] in FINISHED_STATUSES
+
+    def cancel(self):
+        """Ask the job to stop at its next checkpoint"""
+        self.stop_event.set()
+        if not self.finished:
+            self.update(message="Stopping...")
+
+
+class Stage:
+    """One pipeline step with its own bounded input queue and worker threads.
+
+    A stage function may return a concurrent.futures.Future instead of blocking;
+    the worker is then released straight away and the job moves on when the
+    future resolves. `max_pending` caps how many jobs may be in the stage at once.
+    """
+
+    def __init__(self, name, func, concurrency=1, max_queue=10, max_pending=None):
+        self.name = name
+        self.func = func
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max(self.concurrency, max_pending or 0)
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._processed = 0
+        self._failed = 0
+        self._total_seconds = 0.0
+        self._completions = deque(maxlen=100)
+
+    def begin(self):
+        with self._lock:
+            self._busy += 1
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self._busy -= 1
+            self._total_seconds += seconds
+            self._completions.append(time.time())
+            if ok:
+                self._processed += 1
+            else:
+                self._failed += 1
+
+    def stats(self):
+        with self._lock:
+            done = self._processed + self._failed
+            window = self._completions[-1] - self._completions[0] if len(self._completions) > 1 else 0
+            return {
+                "name": self.name,
+                "concurrency": self.concurrency,
+                "max_pending": self.max_pending,
+                "queue_depth": self.queue.qsize(),
+                "max_queue": self.queue.maxsize,
+                "busy": self._busy,
+                "processed": self._processed,
+                "failed": self._failed,
+                "avg_seconds": round(self._total_seconds / done, 3) if done else 0,
+                "throughput_per_min": round((len(self._completions) - 1) * 60 / window, 2) if window else 0,
+            }
+
+
+class Pipeline:
+    """Moves jobs through a chain of stages so different jobs overlap in different stages"""
+
+    def __init__(self, stages):
+        self.stages = stages
+        for index, stage in enumerate(stages):
+            for i in range(stage.concurrency):
+                threading.Thread(target=self._run, args=(index,), name=f"{stage.name}-{i}", daemon=True).start()
+
+    def submit(self, job):
+        """Enqueue a job at the first stage; raises queue.Full when that queue is at capacity"""
+        self.stages[0].queue.put_nowait(job)
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+    def _run(self, index):
+        stage = self.stages[index]
+        while True:
+            job = stage.queue.get()
+            try:
+                self._process(stage, index, job)
+            finally:
+                stage.queue.task_done()
+
+    def _process(self, stage, index, job):
+        if job.finished:
+            return
+        if job.stop_event.is_set():
+            job.update(status="cancelled", message="Stopped.")
+            return
+        if job.status == "queued":
+            job.update(status="running")
+        stage.slots.acquire()
+        stage.begin()
+        started = time.time()
+        try:
+            result = stage.func(job)
+        except Exception as e:
+            self._complete(stage, index, job, started, e)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda f: self._complete(stage, index, job, started, f.exception()))
+        else:
+            self._complete(stage, index, job, started, None)
+
+    def _complete(self, stage, index, job, started, error):
+        stage.record(time.time() - started, error is None)
+        stage.slots.release()
+        if error is not None:
+            job.update(status="error", message=f"Error: {str(error)}")
+            logger.error(f"Job {job.id} failed in stage '{stage.name}': {error}")
+            return
+        if job.finished:
+            return
+        if index + 1 < len(self.stages):
+            # Blocking put: a full downstream queue applies back-pressure to this stage
+            self.stages[index + 1].queue.put(job)
+        else:
+            job.update(status="done", step="Done")
+
+
+class JobQueue:
+    """Registry of submitted jobs feeding a Pipeline with a bounded backlog"""
+
+    def __init__(self, pipeline, history=200, on_change=None):
+        self.pipeline = pipeline
+        self.on_change = on_change
+        self.history = history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, topic="", **data):
+        """Queue a new job; raises queue.Full when the backlog is at capacity"""
+        job = Job(topic, on_change=self.on_change)
+        job.data.update(data)
+        self.pipeline.submit(job)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        if self.on_change:
+            self.on_change(job.id, job.snapshot())
+        logger.info(f"Queued job {job.id} (topic: {topic or 'trending'})")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """Return all tracked jobs, oldest first"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def latest(self):
+        with self._lock:
+            return next(reversed(self._jobs.values()), None)
+
+    def stop(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def stop_all(self):
+        for job in self.jobs():
+            if not job.finished:
+                job.cancel()
+
+    def stats(self):
+        counts = {}
+        for job in self.jobs():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"jobs": counts, "stages": self.pipeline.stats()}
+
+    def _prune(self):
+        # Drop the oldest finished jobs once we track more than `history` of them
+        excess = len(self._jobs) - self.history
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.finished][:excess]:
+            del self._jobs[job_id]
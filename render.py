@@ -0,0 +1,147 @@
+import re
+
+# x264 speed/quality trade-offs selectable per export
+ENCODE_PRESETS = {
+    "fast": {"preset": "ultrafast", "crf": 28, "audio_bitrate": "128k"},
+    "balanced": {"preset": "veryfast", "crf": 23, "audio_bitrate": "192k"},
+    "quality": {"preset": "slow", "crf": 18, "audio_bitrate": "192k"},
+}
+
+# Output formats. safe_area is the (top, bottom, sides) fraction of the frame kept
+# clear of the picture for the platform UI; the picture is fitted inside the rest
+# and the frame filled with a blurred copy of it (or black). width None keeps the
+# source size.
+RENDER_PRESETS = {
+    "shorts_1080": {"width": 1080, "height": 1920, "fps": 30, "max_bitrate": "8M",
+                    "safe_area": (0.08, 0.18, 0.04), "background": "blur", "captions": True},
+    "shorts_720": {"width": 720, "height": 1280, "fps": 30, "max_bitrate": "4M",
+                   "safe_area": (0.08, 0.18, 0.04), "background": "blur", "captions": True},
+    "square_1080": {"width": 1080, "height": 1080, "fps": 30, "max_bitrate": "6M",
+                    "safe_area": (0, 0, 0), "background": "blur", "captions": True},
+    "landscape_1080": {"width": 1920, "height": 1080, "fps": 30, "max_bitrate": "8M",
+                       "safe_area": (0, 0, 0), "background": "black", "captions": False},
+    "source": {"width": None, "height": None, "fps": 30, "max_bitrate": None,
+               "safe_area": (0, 0, 0), "background": "black", "captions": False},
+}
+
+# A still image needs no more than one frame per second; players hold the frame.
+STILL_FPS = 1
+# Still outputs with burned-in captions need enough frames for cues to start and
+# end on time (within 100 ms), but nowhere near the preset's 30 fps
+CAPTION_FPS = 10
+
+
+def escape_filter_path(path):
+    """Quote a file path for use as a filter option value inside a filter graph"""
+    # Inside quotes only ':' (option separator) and the quote itself need escaping
+    path = path.replace("\\", "/").replace(":", "\\:").replace("'", "'\\''")
+    return f"'{path}'"
+
+
+def _bits_per_second(bitrate):
+    number, unit = re.fullmatch(r"(\d+(?:\.\d+)?)([kKmM]?)", bitrate).groups()
+    return float(number) * {"": 1, "k": 1e3, "m": 1e6}[unit.lower()]
+
+
+def _burns_captions(preset, subtitles):
+    return bool(subtitles) and preset["captions"]
+
+
+def preset_filter(label_in, label_out, preset, still=False, subtitles=None):
+    """Filter chain taking one decoded stream to the preset's frame size, rate and captions"""
+    chain = []
+    width, height = preset["width"], preset["height"]
+    if width is None:
+        # yuv420p needs even dimensions
+        chain.append(f"[{label_in}]scale=trunc(iw/2)*2:trunc(ih/2)*2")
+    else:
+        top, bottom, sides = preset["safe_area"]
+        box_w = int(width * (1 - 2 * sides)) // 2 * 2
+        box_h = int(height * (1 - top - bottom)) // 2 * 2
+        fit = f"scale={box_w}:{box_h}:force_original_aspect_ratio=decrease,scale=trunc(iw/2)*2:trunc(ih/2)*2"
+        if preset["background"] == "blur":
+            # In overlay, w/h are the fitted picture's size
+            chain.append(
+                f"[{label_in}]split=2[{label_out}_bg][{label_out}_fg];"
+                f"[{label_out}_bg]scale={width}:{height}:force_original_aspect_ratio=increase,"
+                f"crop={width}:{height},boxblur=20:2[{label_out}_bb];"
+                f"[{label_out}_fg]{fit}[{label_out}_ff];"
+                f"[{label_out}_bb][{label_out}_ff]overlay="
+                f"x={int(width * sides)}+({box_w}-w)/2:y={int(height * top)}+({box_h}-h)/2"
+            )
+        else:
+            chain.append(
+                f"[{label_in}]{fit},pad={width}:{height}:"
+                f"x={int(width * sides)}+({box_w}-iw)/2:y={int(height * top)}+({box_h}-ih)/2:color=black"
+            )
+        chain.append("setsar=1")
+    if not still:
+        chain.append(f"fps={preset['fps']}")
+    elif _burns_captions(preset, subtitles):
+        chain.append(f"fps={CAPTION_FPS}")
+    if _burns_captions(preset, subtitles):
+        chain.append(f"subtitles=filename={escape_filter_path(subtitles)}")
+    chain.append("format=yuv420p")
+    return ",".join(chain) + f"[{label_out}]"
+
+
+def render_args(source, outputs, audio=None, still=False, encode="balanced", subtitles=None, threads=None):
+    """ffmpeg arguments rendering `source` to every (preset name, output path) in `outputs`.
+
+    The source is decoded once and split into one branch per preset, so several
+    formats cost a single decode and a single pass; scaling, safe-area fitting,
+    the background fill and burned-in subtitles all happen in that one filter
+    graph. A still image is fed at STILL_FPS; outputs without captions keep that
+    rate with a GOP longer than any short, so their video stream is a single
+    keyframe followed by near-empty P-frames, while captioned outputs are
+    brought up to CAPTION_FPS before the subtitles are drawn. Audio
+    comes from `audio` if given, otherwise from the source; AAC is copied as is.
+    `threads` caps the whole render: the filter graph gets that many threads and
+    the encoders share them.
+    """
+    quality = ENCODE_PRESETS[encode]
+    encoder_threads = max(1, threads // len(outputs)) if threads else None
+    if still:
+        args = ["-loop", "1", "-framerate", str(STILL_FPS), "-i", source]
+    else:
+        args = ["-i", source]
+    audio_map = "0:a?"
+    if audio:
+        args += ["-i", audio]
+        audio_map = "1:a"
+
+    labels = [f"v{i}" for i in range(len(outputs))]
+    graph = []
+    if len(outputs) > 1:
+        graph.append("[0:v]split=" + str(len(outputs)) + "".join(f"[{label}_in]" for label in labels))
+        inputs = [f"{label}_in" for label in labels]
+    else:
+        inputs = ["0:v"]
+    for label_in, label, (name, _) in zip(inputs, labels, outputs):
+        graph.append(preset_filter(label_in, label, RENDER_PRESETS[name], still, subtitles))
+    if threads:
+        args += ["-filter_complex_threads", str(threads)]
+    args += ["-filter_complex", ";".join(graph)]
+
+    copy_audio = (audio or source).lower().endswith((".m4a", ".aac"))
+    for label, (name, output_path) in zip(labels, outputs):
+        preset = RENDER_PRESETS[name]
+        args += ["-map", f"[{label}]", "-map", audio_map,
+                 "-c:v", "libx264", "-preset", quality["preset"], "-crf", str(quality["crf"])]
+        if encoder_threads:
+            args += ["-threads", str(encoder_threads)]
+        if preset["max_bitrate"]:
+            bufsize = int(_bits_per_second(preset["max_bitrate"]) * 2)
+            args += ["-maxrate", preset["max_bitrate"], "-bufsize", str(bufsize)]
+        if still and _burns_captions(preset, subtitles):
+            # Only the caption area changes between frames; a keyframe every 10 s keeps seeking cheap
+            args += ["-tune", "stillimage", "-g", str(CAPTION_FPS * 10)]
+        elif still:
+            args += ["-tune", "stillimage", "-r", str(STILL_FPS), "-g", "10000"]
+        if copy_audio:
+            args += ["-c:a", "copy"]
+        else:
+            args += ["-c:a", "aac", "-b:a", quality["audio_bitrate"]]
+        # Explicit muxer: the path may end in .part while the export is running
+        args += ["-shortest", "-movflags", "+faststart", "-f", "mp4", output_path]
+    return args
@@ -0,0 +1,176 @@
+import fnmatch
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("shorts_generator")
+
+# Files still being written (or just finished) are never candidates
+DEFAULT_MIN_AGE = 30 * 60
+
+
+def _scan(directory):
+    """Yield (path, size, mtime) for regular files under directory, without following symlinks"""
+    stack = [directory]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            yield os.path.normpath(entry.path), st.st_size, st.st_mtime
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def _matches(relpath, patterns):
+    return any(fnmatch.fnmatch(part, pattern) for part in relpath.split(os.sep) for pattern in patterns)
+
+
+def _remove_empty_dirs(deleted, root):
+    """Remove folders below root that the deletions left empty, innermost first"""
+    dirs = set()
+    for path in deleted:
+        parent = os.path.dirname(path)
+        while parent != root and os.path.commonpath([parent, root]) == root:
+            dirs.add(parent)
+            parent = os.path.dirname(parent)
+    for directory in sorted(dirs, key=len, reverse=True):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
+
+
+class RetentionEngine:
+    """Deletes old generated media according to per-directory policies.
+
+    Each policy is a dict with a "path" and any of:
+      max_age_days   delete files older than this
+      max_gb         delete oldest files until the directory is under this size
+      keep_last_n    always keep the newest N shorts of each topic
+      keep_published always keep files the catalog marks as published (default True)
+      dry_run        only report what the policy would delete (default False)
+      match          only consider files whose name, or the name of a folder
+                     they are in below "path", matches one of these globs
+    A short is every file of one job (script, audio, captions, image, video).
+    Topics, jobs and the published flag come from the asset catalog when one is
+    given; files it does not know are grouped by their parent folder, and into
+    shorts by file name without the extension. Work is paced:
+    after every `batch_size` files stat'ed or deleted the engine sleeps `pause`
+    seconds, so a sweep over a large tree does not saturate the disk.
+    """
+
+    def __init__(self, policies, catalog=None, interval=1800, batch_size=500, pause=0.05,
+                 min_age=DEFAULT_MIN_AGE):
+        self.policies = policies
+        self.catalog = catalog
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.min_age = min_age
+        self.last_report = None
+        self._lock = threading.Lock()
+        self._ops = 0
+
+    def _tick(self):
+        self._ops += 1
+        if self._ops % self.batch_size == 0:
+            time.sleep(self.pause)
+
+    def _plan(self, policy, now):
+        directory = os.path.normpath(policy["path"])
+        known = self.catalog.entries_under(directory) if self.catalog else {}
+        files = []
+        for path, size, mtime in _scan(directory):
+            files.append((path, size, mtime))
+            self._tick()
+        files.sort(key=lambda f: f[2], reverse=True)
+        total = sum(size for _, size, _ in files)
+
+        patterns = policy.get("match")
+        keep_published = policy.get("keep_published", True)
+        keep_last_n = policy.get("keep_last_n")
+        max_age = policy["max_age_days"] * 86400 if policy.get("max_age_days") is not None else None
+        # Shorts of each topic in newest-first order, ranked by their newest file
+        per_topic = {}
+        candidates, delete = [], []
+        for path, size, mtime in files:
+            topic, published, job_id = known.get(path, (None, False, None))
+            topic = topic or os.path.basename(os.path.dirname(path))
+            short = job_id or os.path.splitext(path)[0]
+            shorts = per_topic.setdefault(topic, {})
+            rank = shorts.setdefault(short, len(shorts) + 1)
+            if now - mtime < self.min_age or (keep_published and published):
+                continue
+            if patterns and not _matches(os.path.relpath(path, directory), patterns):
+                continue
+            if keep_last_n and rank <= keep_last_n:
+                continue
+            if max_age is not None and now - mtime > max_age:
+                delete.append((path, size))
+            else:
+                candidates.append((path, size))
+
+        remaining = total - sum(size for _, size in delete)
+        if policy.get("max_gb") is not None:
+            limit = policy["max_gb"] * 1024 ** 3
+            # candidates are newest first, so evict from the end
+            while remaining > limit and candidates:
+                path, size = candidates.pop()
+                delete.append((path, size))
+                remaining -= size
+        return {
+            "path": directory,
+            "dry_run": bool(policy.get("dry_run")),
+            "files": len(files),
+            "bytes": total,
+            "delete": [path for path, _ in delete],
+            "freed_bytes": total - remaining,
+        }
+
+    def run_once(self, dry_run=False):
+        """Apply every policy once and return what was (or, with dry_run, would be) deleted"""
+        with self._lock:
+            now = time.time()
+            report = []
+            for policy in self.policies:
+                if not os.path.isdir(policy["path"]):
+                    continue
+                plan = self._plan(policy, now)
+                if not dry_run and not plan["dry_run"]:
+                    deleted = []
+                    for path in plan["delete"]:
+                        try:
+                            os.remove(path)
+                            deleted.append(path)
+                        except OSError as e:
+                            logger.error(f"Retention could not delete {path}: {e}")
+                        self._tick()
+                    if self.catalog and deleted:
+                        self.catalog.remove_many(deleted)
+                    _remove_empty_dirs(deleted, plan["path"])
+                    plan["delete"] = deleted
+                    logger.info(f"Retention removed {len(deleted)} file(s) from {plan['path']}")
+                report.append(plan)
+            result = {"dry_run": dry_run, "ran_at": now, "directories": report}
+            if not dry_run:
+                self.last_report = result
+            return result
+
+    def start(self):
+        threading.Thread(target=self._loop, name="retention", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
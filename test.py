@@ -5,13 +5,17 @@ import json
 import os
 import time
 import logging
-import requests
 from datetime import datetime
 import sys
 import subprocess
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
 import tweepy
 from groq import Groq
+from http_client import get_client
+from cache import DiskCache, normalize_script, tts_cache_key
+from dedup import HeadlineIndex
+from catalog import AssetCatalog
 
 # Configure logging
 logging.basicConfig(
@@ -46,7 +50,7 @@ DEFAULT_CONFIG = {
 }
 
 # Ensure directories exist
-for directory in ['config', 'output', 'logs', 'temp', 'scripts', 'media']:
+for directory in ['config', 'output', 'logs', 'temp', 'scripts', 'media', 'cache']:
     os.makedirs(directory, exist_ok=True)
 
 CONFIG_FILE = "config/settings.json"
@@ -109,6 +113,9 @@ class ShortsGeneratorApp:
         # Load configuration
         self.config = load_config()
         
+        # Index of generated files, queried instead of scanning the output folder
+        self.catalog = AssetCatalog(os.path.join("config", "catalog.db"))
+        
         # Create the notebook (tabs)
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -135,6 +142,16 @@ class ShortsGeneratorApp:
         # Bind closing event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
+        # Catalog videos that were added to the output folder outside this app
+        threading.Thread(target=self.sync_catalog, daemon=True).start()
+        
+        # Shared HTTP session and Groq client, reused across calls
+        self.http = get_client()
+        self.headline_index = HeadlineIndex(os.path.join("cache", "seen_topics.jsonl"), max_age_days=1)
+        self.audio_cache = DiskCache(os.path.join("cache", "audio"), max_bytes=500 * 1024 * 1024, suffix=".mp3")
+        self._groq_client = None
+        self._groq_key = None
+        
         # Generator thread
         self.generator_thread = None
         self.stop_event = threading.Event()
@@ -245,14 +262,21 @@ class ShortsGeneratorApp:
         
         # Fetch trends for a specific location (WOEID 1 is worldwide)
         trends = api.get_place_trends(1)[0]["trends"]
-        # Pick the top trend with a tweet volume
+        # Pick the top trend with a tweet volume that we have not covered today
         for trend in trends:
-            if trend["tweet_volume"]:
+            if trend["tweet_volume"] and self.headline_index.claim(trend["name"], trend.get("url")):
                 return trend["name"]
         return "Technology News"  # Fallback topic
+    def get_groq_client(self):
+        """Return a Groq client for the current key, reusing it while the key is unchanged"""
+        api_key = self.config["api_keys"]["groq_api_key"]
+        if self._groq_client is None or self._groq_key != api_key:
+            self._groq_client = Groq(api_key=api_key, timeout=30, max_retries=3)
+            self._groq_key = api_key
+        return self._groq_client
     def generate_script(self, topic):
         """Generate a 30-second script using Groq"""
-        client = Groq(api_key=self.config["api_keys"]["groq_api_key"])
+        client = self.get_groq_client()
         prompt = (
             f"Write a concise script for a 30-second video about '{topic}'. "
             f"Keep it engaging, with 3-4 sentences suitable for narration."
@@ -268,14 +292,20 @@ class ShortsGeneratorApp:
         voice_id = self.config["settings"]["voice_id"]
         api_key = self.config["api_keys"]["elevenlabs_api_key"]
         
-        response = requests.post(
+        # Retries and re-runs of the same script skip the TTS round-trip
+        key = tts_cache_key(voice_id, script)
+        if self.audio_cache.get_file(key, output_path):
+            return True
+        
+        response = self.http.post(
             f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}",
             headers={"xi-api-key": api_key},
-            json={"text": script}
+            json={"text": normalize_script(script)}
         )
         if response.status_code == 200:
             with open(output_path, "wb") as f:
                 f.write(response.content)
+            self.audio_cache.put_file(key, output_path)
             return True
         else:
             raise Exception(f"ElevenLabs API error: {response.status_code} - {response.text}")
@@ -283,19 +313,32 @@ class ShortsGeneratorApp:
     def fetch_image(self, topic, output_path):
         """Fetch an image from Unsplash"""
         api_key = self.config["api_keys"]["unsplash_api_key"]
-        response = requests.get(
+        response = self.http.get(
             "https://api.unsplash.com/photos/random",
             params={"query": topic, "client_id": api_key}
         )
         if response.status_code == 200:
             image_url = response.json()["urls"]["regular"]
-            image_data = requests.get(image_url).content
-            with open(output_path, "wb") as f:
-                f.write(image_data)
+            self.http.download(image_url, output_path)
             return True
         else:
             raise Exception(f"Unsplash API error: {response.status_code} - {response.text}")
 
+    def generate_media(self, topic, script_content, base_filename):
+        """Generate audio and fetch the image concurrently, since neither depends on the other"""
+        audio_path = os.path.join("temp", f"{base_filename}.mp3")
+        image_path = os.path.join("media", f"{base_filename}.jpg")
+        self.update_progress("Converting script to audio with ElevenLabs and fetching image from Unsplash...")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            audio_future = executor.submit(self.generate_audio, script_content, audio_path)
+            image_future = executor.submit(self.fetch_image, topic, image_path)
+            audio_future.result()
+            self.catalog.record(audio_path, "audio", topic=topic)
+            self.update_progress(f"Audio saved to {audio_path}")
+            image_future.result()
+            self.catalog.record(image_path, "image", topic=topic)
+            self.update_progress(f"Image saved to {image_path}")
+        return audio_path, image_path
         
     def setup_api_keys_tab(self):
         """Create the API keys configuration tab"""
@@ -573,40 +616,33 @@ class ShortsGeneratorApp:
             except:
                 messagebox.showerror("Error", "Failed to export logs.")
 
+    def sync_catalog(self):
+        """Add untracked files in the output folder to the catalog and refresh the list if any were found"""
+        try:
+            if self.catalog.sync_directory(self.config["settings"]["output_directory"]):
+                self.root.after(0, self.load_recent_videos)
+        except Exception as e:
+            logger.error(f"Error syncing asset catalog: {e}")
+
     def load_recent_videos(self):
         """Load and display recent videos"""
         # Clear existing items
         for item in self.videos_tree.get_children():
             self.videos_tree.delete(item)
         
-        # Look for videos in the output directory
         output_dir = self.config["settings"]["output_directory"]
-        if not os.path.exists(output_dir):
-            return
-        
         try:
-            # Get video files
-            video_files = []
-            for file in os.listdir(output_dir):
-                if file.endswith((".mp4", ".mov", ".avi")):
-                    file_path = os.path.join(output_dir, file)
-                    created_time = os.path.getctime(file_path)
-                    # For a real application, you would get actual duration from the video file
-                    # For this example, we'll just use a placeholder
-                    duration = "30s"
-                    title = file.replace("short_", "").replace(".mp4", "").replace("_", " ")
-                    video_files.append((title, duration, datetime.fromtimestamp(created_time), file))
-            
-            # Sort by creation time (newest first)
-            video_files.sort(key=lambda x: x[2], reverse=True)
-            
-            # Add to treeview
-            for video in video_files:
+            # Newest first, straight from the catalog index
+            videos, _ = self.catalog.query(kind="video", under=output_dir, limit=200)
+            for video in videos:
+                filename = os.path.relpath(video["path"], output_dir)
+                title = video["topic"] or os.path.splitext(os.path.basename(filename))[0].replace("short_", "").replace("_", " ")
+                duration = f"{round(video['duration'])}s" if video["duration"] else "-"
                 self.videos_tree.insert("", tk.END, values=(
-                    video[0],
-                    video[1],
-                    video[2].strftime("%Y-%m-%d %H:%M"),
-                    video[3]
+                    title,
+                    duration,
+                    datetime.fromtimestamp(video["created_at"]).strftime("%Y-%m-%d %H:%M"),
+                    filename
                 ))
         except Exception as e:
             logger.error(f"Error loading videos: {e}")
@@ -673,6 +709,7 @@ class ShortsGeneratorApp:
             try:
                 if os.path.exists(file_path):
                     os.remove(file_path)
+                    self.catalog.remove(file_path)
                     self.videos_tree.delete(selection[0])
                     messagebox.showinfo("Success", "Video deleted successfully!")
                 else:
@@ -761,19 +798,11 @@ class ShortsGeneratorApp:
                 script_path = os.path.join("scripts", f"{base_filename}.txt")
                 with open(script_path, "w", encoding="utf-8") as f:
                     f.write(script_content)
+                self.catalog.record(script_path, "script", topic=topic)
                 self.update_progress(f"Script saved to {script_path}")
 
-                # Generate and save audio
-                self.update_progress("Converting script to audio with ElevenLabs...")
-                audio_path = os.path.join("temp", f"{base_filename}.mp3")
-                self.generate_audio(script_content, audio_path)
-                self.update_progress(f"Audio saved to {audio_path}")
-
-                # Fetch and save image
-                self.update_progress("Fetching image from Unsplash...")
-                image_path = os.path.join("media", f"{base_filename}.jpg")
-                self.fetch_image(topic, image_path)
-                self.update_progress(f"Image saved to {image_path}")
+                # Generate audio and fetch image in parallel
+                self.generate_media(topic, script_content, base_filename)
 
                 self.update_progress(f"Assets for '{topic}' stored locally.")
 
@@ -844,19 +873,11 @@ class ShortsGeneratorApp:
             script_path = os.path.join("scripts", f"{base_filename}.txt")
             with open(script_path, "w", encoding="utf-8") as f:
                 f.write(script_content)
+            self.catalog.record(script_path, "script", topic=topic)
             self.update_progress(f"Script saved to {script_path}")
 
-            # Step 2: Generate and save audio
-            self.update_progress("Converting script to audio with ElevenLabs...")
-            audio_path = os.path.join("temp", f"{base_filename}.mp3")
-            self.generate_audio(script_content, audio_path)
-            self.update_progress(f"Audio saved to {audio_path}")
-
-            # Step 3: Fetch and save image
-            self.update_progress("Fetching image from Unsplash...")
-            image_path = os.path.join("media", f"{base_filename}.jpg")
-            self.fetch_image(topic, image_path)
-            self.update_progress(f"Image saved to {image_path}")
+            # Step 2: Generate audio and fetch image in parallel
+            audio_path, image_path = self.generate_media(topic, script_content, base_filename)
 
             self.update_progress(f"Assets for '{topic}' prepared and stored locally.")
             self.root.after(0, lambda: messagebox.showinfo("Success", f"Assets generated!\n\nScript: {script_path}\nAudio: {audio_path}\nImage: {image_path}"))
@@ -943,8 +964,7 @@ class ShortsGeneratorApp:
         self.root.update_idletasks()
         
         try:
-            import requests
-            response = requests.get(
+            response = self.http.get(
                 "https://api.elevenlabs.io/v1/voices",
                 headers={"xi-api-key": api_key}
             )
@@ -974,8 +994,7 @@ class ShortsGeneratorApp:
         self.root.update_idletasks()
         
         try:
-            import requests
-            response = requests.get(
+            response = self.http.get(
                 "https://api.unsplash.com/photos/random",
                 params={"client_id": api_key}
             )
@@ -0,0 +1,117 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger("shorts_generator")
+
+
+class UsageLimitError(Exception):
+    """Raised when an API call would exceed its daily quota or rate limit"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UsageTracker:
+    """Per-API daily quotas and token-bucket rate limits kept in memory.
+
+    acquire() only takes a lock and updates counters; the usage file is rewritten
+    by a background thread at most every `flush_interval` seconds, and only when
+    something changed, via a temp file and os.replace so it is never half-written.
+    `limits` maps an API name to {"daily": calls per day, "per_minute": calls per
+    minute}; either may be omitted, and unknown APIs are counted but not limited.
+    """
+
+    def __init__(self, path, limits, flush_interval=5.0):
+        self.path = path
+        self.limits = limits
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Held across snapshot, write and replace so concurrent flushes cannot interleave
+        self._write_lock = threading.Lock()
+        self._usage = {}
+        self._buckets = {}
+        self._dirty = False
+        self._load()
+        threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self._usage = json.load(f)
+        except (OSError, ValueError):
+            logger.error(f"Error loading API usage from {self.path}, starting fresh")
+
+    def seed(self, api_name, used, reset_date):
+        """Carry over a counter from an older store if we have nothing recorded for that API"""
+        with self._lock:
+            if api_name not in self._usage:
+                self._usage[api_name] = {"used": used, "reset_date": reset_date}
+                self._dirty = True
+
+    def _take_token(self, api_name, per_minute):
+        # Token bucket holding up to `per_minute` tokens, refilled continuously
+        now = time.monotonic()
+        tokens, last = self._buckets.get(api_name, (float(per_minute), now))
+        tokens = min(float(per_minute), tokens + (now - last) * per_minute / 60.0)
+        if tokens < 1:
+            self._buckets[api_name] = (tokens, now)
+            return (1 - tokens) * 60.0 / per_minute
+        self._buckets[api_name] = (tokens - 1, now)
+        return 0
+
+    def acquire(self, api_name, block=False):
+        """Count one call, raising UsageLimitError if over quota (or waiting for a token when block=True)"""
+        while True:
+            with self._lock:
+                limit = self.limits.get(api_name, {})
+                today = datetime.now().strftime("%Y-%m-%d")
+                usage = self._usage.setdefault(api_name, {"used": 0, "reset_date": today})
+                if usage["reset_date"] != today:
+                    usage["used"] = 0
+                    usage["reset_date"] = today
+                daily = limit.get("daily")
+                if daily is not None and usage["used"] >= daily:
+                    raise UsageLimitError(f"{api_name.capitalize()} API daily limit reached ({daily} calls)")
+                wait = self._take_token(api_name, limit["per_minute"]) if limit.get("per_minute") else 0
+                if not wait:
+                    usage["used"] += 1
+                    self._dirty = True
+                    return dict(usage, daily=daily)
+            if not block:
+                raise UsageLimitError(f"{api_name.capitalize()} API rate limit reached ({limit['per_minute']}/min)", retry_after=wait)
+            time.sleep(wait)
+
+    def snapshot(self):
+        with self._lock:
+            return {api: dict(usage, **self.limits.get(api, {})) for api, usage in self._usage.items()}
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = json.dumps(self._usage, indent=4)
+                self._dirty = False
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.error(f"Error saving API usage: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()